@@ -1,27 +1,858 @@
 #!/usr/bin/env python3
 
 from http.server import HTTPServer, BaseHTTPRequestHandler
+import argparse
+import asyncio
+import base64
+import bisect
+import codecs
+import hashlib
+import heapq
+import io
 import json
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import urllib.parse
 import os
+import queue
 from flask import Flask, render_template, request, redirect, url_for, session, flash
-from werkzeug.security import check_password_hash
 from http.cookies import SimpleCookie
 import secrets
+import signal
+import socket
+import sqlite3
+import threading
 import time
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from storage import JSONStore, generate_cert_number, open_store
+from importer import CertificateImporter, ChunkReader, build_certificate, open_rows
+from templating import TemplateCache
+from staticfiles import StaticFiles, etag_matches
+from search import SearchIndex
+from bloom import CertificateFilter
+from records import CertificateRecord
+from passwords import PasswordPool, PasswordPoolBusy
+from ratelimit import RateLimiter, RouteLimiter, parse_limit
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, TimedStore
+from profiling import (REPORT_FORMATS, SORT_KEYS, RequestPhases, SamplingProfiler, SlowRequestLog, TimedWriter,
+                       request_id)
+from qr import CONTENT_TYPES as QR_CONTENT_TYPES, QRImages, verify_url
+
+SESSIONS_DB = 'data/sessions.db'
+
+class CertificateIndex:
+    """Process-wide certificate lookup table keyed by cert_number.
+
+    The table is rebuilt lazily when the store reports a new version (for
+    the JSON store: mtime, size or inode of the file) or after a write
+    handler calls invalidate(). Certificates are held as CertificateRecord
+    objects. Each rebuild passes the changed records to the registered
+    listeners as {cert_number: (old record, new record)}, with None for a
+    side that does not exist.
+
+    Until something needs the whole table (the admin pages do), lookups are
+    served from the store's memory-mapped record index when it has an up to
+    date one, so verification does not have to load every certificate.
+    Listeners are not called in that mode; reload_listeners are, without
+    arguments, whenever the store changes.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.listeners = []
+        self.reload_listeners = []
+        self.records = None
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._signature = None
+        self._entries = {}
+
+    def _rebuild(self, signature):
+        entries = {}
+        for cert in self.store.load_certificates():
+            # Keep the first occurrence, like the former linear scan did
+            if cert['cert_number'] not in entries:
+                entries[cert['cert_number']] = CertificateRecord.from_dict(cert)
+        previous = self._entries
+        self._entries = entries
+        self._signature = signature
+        if self.listeners:
+            changes = {}
+            for cert_number in previous.keys() | entries.keys():
+                old = previous.get(cert_number)
+                new = entries.get(cert_number)
+                if old is None or new is None or old != new:
+                    changes[cert_number] = (old, new)
+            for listener in self.listeners:
+                listener(changes)
+
+    def invalidate(self):
+        """Force a rebuild on the next lookup (call after writing the file)"""
+        with self._lock:
+            self._signature = None
+
+    def refresh(self, full=True):
+        """Bring the index up to date with the store.
+
+        With full=False the record index is enough, if the table has not
+        been loaded yet and the store has a current one.
+        """
+        signature = self.store.version()
+        if signature == self._signature and (self.loaded or not full):
+            return
+        with self._lock:
+            if signature == self._signature and (self.loaded or not full):
+                return
+            if not full and not self.loaded:
+                record_index = getattr(self.store, 'record_index', None)
+                records = record_index() if record_index else None
+                if records is not None:
+                    self.records = records
+                    self._signature = signature
+                    for listener in self.reload_listeners:
+                        listener()
+                    return
+            self._rebuild(signature)
+            self.loaded = True
+            self.records = None
+
+    def get(self, cert_number):
+        self.refresh(full=False)
+        records = self.records
+        if records is not None:
+            cert = records.get(cert_number)
+            return CertificateRecord.from_dict(cert) if cert is not None else None
+        return self._entries.get(cert_number)
+
+    def __len__(self):
+        records = self.records
+        return len(records) if records is not None else len(self._entries)
+
+    def cert_numbers(self):
+        records = self.records
+        return records.cert_numbers() if records is not None else list(self._entries)
+
+class CertificateStats:
+    """Dashboard aggregates kept up to date from certificate index changes.
+
+    Expiry dates are held as a sorted list of date ordinals, so expired and
+    expiring-soon counts are a couple of bisections instead of a full scan.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.expiries = []
+        self.types = Counter()
+        self._lock = threading.Lock()
+
+    def apply(self, changes):
+        with self._lock:
+            if len(changes) > max(64, self.total // 8):
+                self._apply_bulk(changes)
+                return
+            for old, new in changes.values():
+                if old is not None:
+                    self._remove(old)
+                if new is not None:
+                    self._add(new)
+
+    def _apply_bulk(self, changes):
+        """Re-sort the expiries once; inserting each of many changes is quadratic"""
+        removed = Counter()
+        added = []
+        for old, new in changes.values():
+            for record, sign in ((old, -1), (new, 1)):
+                if record is None:
+                    continue
+                cert_type = record.type or 'Unknown'
+                self.total += sign
+                self.types[cert_type] += sign
+                if self.types[cert_type] <= 0:
+                    del self.types[cert_type]
+                if record.expires is not None:
+                    if sign < 0:
+                        removed[record.expires] += 1
+                    else:
+                        added.append(record.expires)
+        expiries = []
+        for ordinal in self.expiries:
+            if removed[ordinal]:
+                removed[ordinal] -= 1
+            else:
+                expiries.append(ordinal)
+        expiries.extend(added)
+        expiries.sort()
+        self.expiries = expiries
+
+    def _add(self, record):
+        self.total += 1
+        self.types[record.type or 'Unknown'] += 1
+        if record.expires is not None:
+            bisect.insort(self.expiries, record.expires)
+
+    def _remove(self, record):
+        self.total -= 1
+        cert_type = record.type or 'Unknown'
+        self.types[cert_type] -= 1
+        if self.types[cert_type] <= 0:
+            del self.types[cert_type]
+        if record.expires is not None:
+            position = bisect.bisect_left(self.expiries, record.expires)
+            del self.expiries[position]
+
+    def snapshot(self, soon_days=30):
+        """Counts as of today; a certificate is expired from its expire_date on"""
+        today = date.today().toordinal()
+        with self._lock:
+            expired = bisect.bisect_right(self.expiries, today)
+            expiring_soon = bisect.bisect_right(self.expiries, today + soon_days) - expired
+            return {
+                'total_certs': self.total,
+                'valid_certs': len(self.expiries) - expired,
+                'expiring_soon': expiring_soon,
+                'expired_certs': expired,
+                'cert_types': len(self.types)
+            }
+
+def _year_of(cert):
+    try:
+        return int(cert.year)
+    except (TypeError, ValueError):
+        return 0
+
+class CertificateListing:
+    """Sorted views of the certificates behind the paginated admin listing.
+
+    One sorted list of (sort value, cert_number) per sort key is kept up to
+    date from certificate index changes. A page is a bisection to the cursor
+    (narrowed by the expiry range when sorting by expire_date) followed by a
+    scan that applies the remaining filters.
+    """
+
+    sort_keys = {
+        'cert_number': lambda cert: str(cert.cert_number),
+        'expire_date': lambda cert: str(cert.expire_date or ''),
+        'owner': lambda cert: str(cert.owner or '').lower(),
+        'year': _year_of
+    }
+    default_limit = 50
+    max_limit = 500
+
+    def __init__(self):
+        self.orders = {name: [] for name in self.sort_keys}
+        self.certs = {}
+        self._lock = threading.Lock()
+
+    def apply(self, changes):
+        with self._lock:
+            if len(changes) > max(64, len(self.certs) // 8):
+                self._apply_bulk(changes)
+                return
+            for cert_number, (old, new) in changes.items():
+                if old is not None:
+                    for name, key in self.sort_keys.items():
+                        order = self.orders[name]
+                        item = (key(old), cert_number)
+                        position = bisect.bisect_left(order, item)
+                        if position < len(order) and order[position] == item:
+                            del order[position]
+                    self.certs.pop(cert_number, None)
+                if new is not None:
+                    for name, key in self.sort_keys.items():
+                        bisect.insort(self.orders[name], (key(new), cert_number))
+                    self.certs[cert_number] = new
+
+    def _apply_bulk(self, changes):
+        """Rebuild the sorted lists in one pass; inserting each of many changes is quadratic"""
+        added = []
+        for cert_number, (old, new) in changes.items():
+            if new is None:
+                self.certs.pop(cert_number, None)
+            else:
+                self.certs[cert_number] = new
+                added.append((cert_number, new))
+        for name, key in self.sort_keys.items():
+            order = [item for item in self.orders[name] if item[1] not in changes]
+            order.extend((key(cert), cert_number) for cert_number, cert in added)
+            order.sort()
+            self.orders[name] = order
+
+    def page(self, sort, descending=False, after=None, limit=50, matches=None, low=None, high=None):
+        """Up to limit certificates following the cursor item, and the last item returned"""
+        with self._lock:
+            order = self.orders[sort]
+            start = bisect.bisect_left(order, (low,)) if low is not None else 0
+            end = bisect.bisect_right(order, (high, '\uffff')) if high is not None else len(order)
+            if descending:
+                if after is not None:
+                    end = min(end, bisect.bisect_left(order, after))
+                positions = range(end - 1, start - 1, -1)
+            else:
+                if after is not None:
+                    start = max(start, bisect.bisect_right(order, after))
+                positions = range(start, end)
+
+            certs = []
+            last = None
+            for position in positions:
+                item = order[position]
+                cert = self.certs[item[1]]
+                if matches is None or matches(cert):
+                    certs.append(cert)
+                    last = item
+                    if len(certs) >= limit:
+                        break
+            return certs, last
+
+    def query(self, params):
+        """Answer a listing request; params maps query names to single values.
+
+        Raises ValueError for malformed parameters.
+        """
+        sort = params.get('sort') or 'cert_number'
+        descending = sort.startswith('-')
+        sort = sort.lstrip('-')
+        if sort not in self.sort_keys:
+            raise ValueError(f"Unknown sort key: {sort}")
+        limit = int(params.get('limit') or self.default_limit)
+        limit = max(1, min(limit, self.max_limit))
+
+        after = None
+        if params.get('cursor'):
+            try:
+                cursor = json.loads(base64.urlsafe_b64decode(params['cursor'].encode()))
+                cursor_sort, cursor_descending, value, cert_number = cursor
+            except (TypeError, ValueError):
+                raise ValueError('Invalid cursor')
+            if cursor_sort != sort or cursor_descending != descending:
+                raise ValueError('Cursor does not match the sort order')
+            if not isinstance(value, int if sort == 'year' else str) or not isinstance(cert_number, str):
+                raise ValueError('Invalid cursor')
+            after = (value, cert_number)
+
+        # Expiry bounds as ISO dates, which sort like the dates they name
+        low = params.get('expires_from') or None
+        high = params.get('expires_to') or None
+        for bound in (low, high):
+            if bound is not None:
+                datetime.strptime(bound, '%Y-%m-%d')
+        status = params.get('status')
+        today = date.today()
+        if status in ('valid', 'expiring'):
+            tomorrow = (today + timedelta(days=1)).isoformat()
+            low = max(low or tomorrow, tomorrow)
+        if status == 'expiring':
+            soon = (today + timedelta(days=30)).isoformat()
+            high = min(high or soon, soon)
+        elif status == 'expired':
+            high = min(high or today.isoformat(), today.isoformat())
+        elif status not in (None, '', 'valid'):
+            raise ValueError(f"Unknown status: {status}")
+
+        cert_type = params.get('type') or None
+        year = int(params['year']) if params.get('year') else None
+
+        def matches(cert):
+            expire_date = str(cert.expire_date or '')
+            if low is not None and expire_date < low:
+                return False
+            if high is not None and expire_date > high:
+                return False
+            if cert_type is not None and cert.type != cert_type:
+                return False
+            if year is not None and _year_of(cert) != year:
+                return False
+            return True
+
+        bounds = (low, high) if sort == 'expire_date' else (None, None)
+        certs, last = self.page(sort, descending, after, limit, matches, *bounds)
+        next_cursor = None
+        if len(certs) == limit and last is not None:
+            next_cursor = base64.urlsafe_b64encode(
+                json.dumps([sort, descending, last[0], last[1]]).encode()).decode()
+        return {'certificates': [cert.to_dict() for cert in certs], 'next_cursor': next_cursor}
+
+# verify_certificate result for numbers that were never issued
+NOT_FOUND_RESULT = {
+    'found': False,
+    'valid': False,
+    'status': 'invalid',
+    'message': 'Certificate not found'
+}
+
+# A rendered verification response
+CachedResponse = namedtuple('CachedResponse', ['body', 'content_type', 'etag', 'valid_until'])
+
+class VerificationCache:
+    """LRU cache of rendered /verify and /api/verify responses.
+
+    Keys are (cert_number, last_name, first_name, kind). Entries are dropped
+    when the certificate index reports their certificate as changed, and a
+    response for a valid certificate is only reused until it expires.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._keys_by_cert = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None and response.valid_until is not None and time.time() >= response.valid_until:
+                self._remove(key)
+                response = None
+            if response is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return response
+
+    @staticmethod
+    def build(body, content_type, valid_until=None):
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        return CachedResponse(body, content_type, etag, valid_until)
+
+    def put(self, key, response, generation):
+        """Cache a response unless an invalidation ran since generation was read"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = response
+            self._keys_by_cert.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, cert_numbers):
+        if not cert_numbers:
+            return
+        with self._lock:
+            self.generation += 1
+            for cert_number in cert_numbers:
+                for key in self._keys_by_cert.pop(cert_number, ()):
+                    self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry (the changed certificates are not known)"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._keys_by_cert.clear()
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._keys_by_cert.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_cert[key[0]]
+
+# Storage backend, replaced by configure_store() when run_server starts
+metrics = Registry()
+store_duration = metrics.histogram(
+    'certverif_store_operation_duration_seconds', 'Storage backend reads and writes', ('operation',))
+# Phase timings of the request each thread is handling, for the slow-request log
+request_phases = RequestPhases()
+
+def observe_store(operation, seconds):
+    store_duration.observe(seconds, (operation,))
+    request_phases.add('store', seconds)
+
+store = TimedStore(JSONStore(), observe_store)
+certificate_index = CertificateIndex(store)
+verification_cache = VerificationCache()
+certificate_stats = CertificateStats()
+certificate_listing = CertificateListing()
+certificate_search = SearchIndex()
+certificate_filter = CertificateFilter(certificate_index)
+certificate_index.listeners.append(verification_cache.invalidate)
+certificate_index.listeners.append(certificate_stats.apply)
+certificate_index.listeners.append(certificate_listing.apply)
+certificate_index.listeners.append(certificate_search.apply)
+certificate_index.listeners.append(certificate_filter.apply)
+certificate_index.reload_listeners.append(verification_cache.clear)
+certificate_index.reload_listeners.append(certificate_filter.reload)
+
+def configure_store(backend='json', database=None):
+    """Switch the process-wide storage backend"""
+    global store
+    store = TimedStore(open_store(backend, database) if database else open_store(backend), observe_store)
+    certificate_index.store = store
+    certificate_index.invalidate()
+    return store
+
+# Compiled page templates; run_server(dev=True) turns on the file watcher
+templates = TemplateCache()
+static_files = StaticFiles()
+# Rendered /qr/ images: an LRU per process over a disk cache shared by all
+qr_images = QRImages()
+
+def render_page(name, **values):
+    with request_phases.phase('render'):
+        return templates.render(name, **values)
+
+# scrypt runs in worker processes; logins are throttled per username and per
+# client IP (a burst of 5 attempts, then one every 10 seconds)
+password_pool = PasswordPool()
+login_throttle = RateLimiter(rate=0.1, burst=5)
+
+# Public verification limits per client: (requests per second, burst).
+# Batch verification is charged per certificate in the batch.
+VERIFY_RATE_LIMITS = {
+    'verify': (2, 30),
+    'api': (5, 60),
+    'batch': (50, 1000),
+    'qr': (5, 60)
+}
+verify_limiter = RouteLimiter(VERIFY_RATE_LIMITS)
+
+# Request metrics are labelled by route rather than raw path, so that cert
+# numbers and file names do not each create a new series
+METRIC_ROUTES = {
+    '/', '/metrics', '/admin/login', '/admin/logout', '/admin/dashboard', '/admin/settings',
+    '/admin/certificates', '/admin/certificates/new', '/admin/certificates/import',
+    '/admin/admins', '/admin/admins/new', '/admin/api/certificates', '/admin/api/search',
+    '/admin/api/lookup-filter', '/admin/api/slow-requests', '/admin/api/profiler',
+    '/admin/api/profiler/profile', '/api/verify/batch'
+}
+METRIC_ROUTE_PREFIXES = (
+    '/verify/', '/api/verify/', '/qr/', '/static/', '/admin/certificates/edit/', '/admin/certificates/delete/',
+    '/admin/admins/edit/', '/admin/admins/delete/'
+)
+METRIC_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'DELETE'}
+
+def route_label(path):
+    path = path.split('?', 1)[0]
+    if path in METRIC_ROUTES:
+        return path
+    for prefix in METRIC_ROUTE_PREFIXES:
+        if path.startswith(prefix):
+            return prefix + '*'
+    return 'other'
+
+http_requests = metrics.counter(
+    'certverif_http_requests_total', 'HTTP requests by method, route and status', ('method', 'route', 'status'))
+http_duration = metrics.histogram(
+    'certverif_http_request_duration_seconds', 'Time from parsed request to finished response', ('method', 'route'))
+http_in_flight = metrics.gauge('certverif_http_requests_in_flight', 'Requests being handled')
+
+def cache_lookups():
+    return {
+        ('verification', 'hit'): verification_cache.hits,
+        ('verification', 'miss'): verification_cache.misses,
+        ('static', 'hit'): static_files.hits,
+        ('static', 'miss'): static_files.misses,
+        ('qr', 'hit'): qr_images.hits,
+        ('qr', 'miss'): qr_images.misses
+    }
+
+def cache_hit_ratios():
+    lookups = cache_lookups()
+    ratios = {}
+    for cache in ('verification', 'static', 'qr'):
+        total = lookups[(cache, 'hit')] + lookups[(cache, 'miss')]
+        ratios[(cache,)] = lookups[(cache, 'hit')] / total if total else 0
+    return ratios
+
+metrics.callback('certverif_cache_lookups_total', 'Response and static file cache lookups', 'counter',
+                 cache_lookups, ('cache', 'result'))
+metrics.callback('certverif_cache_hit_ratio', 'Share of cache lookups that were hits', 'gauge',
+                 cache_hit_ratios, ('cache',))
+metrics.callback('certverif_cache_entries', 'Entries held by each cache', 'gauge',
+                 lambda: {('verification',): len(verification_cache), ('static',): len(static_files.cache),
+                          ('qr',): len(qr_images)},
+                 ('cache',))
+metrics.callback('certverif_cache_bytes', 'Bytes held by the static file cache', 'gauge',
+                 lambda: static_files.cached_bytes)
+metrics.callback('certverif_certificates', 'Certificates in the lookup index', 'gauge',
+                 lambda: len(certificate_index))
+metrics.callback('certverif_sessions', 'Admin sessions', 'gauge', lambda: CertHandler.sessions.count())
+
+# Requests over the threshold are logged with their phase timings; admins
+# can switch on cProfile sampling, at most a few times a minute each
+slow_requests = SlowRequestLog()
+profiler = SamplingProfiler()
+profiler_switch_throttle = RateLimiter(rate=1 / 20, burst=3)
+MAX_PROFILE_SECONDS = 3600
+
+def iter_json_items(chunks, max_item_size=65536):
+    """Yield the objects of a JSON array or NDJSON document arriving in byte chunks.
+
+    Only one item is held in memory at a time, so arbitrarily large
+    batches can be consumed.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    array = None
+    while True:
+        buffer = buffer.lstrip()
+        if buffer:
+            if array is None:
+                array = buffer[0] == '['
+                if array:
+                    buffer = buffer[1:]
+                continue
+            if array and buffer[0] == ',':
+                buffer = buffer[1:]
+                continue
+            if array and buffer[0] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if len(buffer) > max_item_size:
+                    raise ValueError('Malformed or oversized batch entry')
+            else:
+                yield item
+                buffer = buffer[end:]
+                continue
+        chunk = next(chunks, None)
+        if chunk is None:
+            buffer += text.decode(b'', final=True)
+            if buffer.strip():
+                raise ValueError('Truncated batch request')
+            return
+        buffer += text.decode(chunk)
+
+class MemorySessionStore:
+    """Sessions held in a dict, private to the current process.
+
+    Expiry times are also kept in a min-heap, so expired sessions are
+    dropped as new ones arrive and the sessions closest to expiry are
+    evicted once max_sessions (0 for no limit) is exceeded. With
+    sliding=True a session is renewed for another ttl seconds when it is
+    used after half of its lifetime has passed.
+    """
+
+    def __init__(self, ttl=3600, max_sessions=10000, sliding=False):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sliding = sliding
+        self._sessions = {}
+        self._expiries = []
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        now = time.time()
+        if session['expires'] <= now:
+            self.delete(session_id)
+            return None
+        if self.sliding and session['expires'] - now < self.ttl / 2:
+            session = dict(session, expires=now + self.ttl)
+            self.set(session)
+        return session
+
+    def set(self, session):
+        with self._lock:
+            self._sessions[session['id']] = session
+            heapq.heappush(self._expiries, (session['expires'], session['id']))
+            self._evict(time.time())
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def count(self):
+        """Number of sessions held, including expired ones not yet evicted"""
+        return len(self._sessions)
+
+    def _evict(self, now):
+        heap = self._expiries
+        # Renewed and deleted sessions leave stale heap entries behind
+        if len(heap) > 2 * len(self._sessions) + 64:
+            heap[:] = [(session['expires'], session_id) for session_id, session in self._sessions.items()]
+            heapq.heapify(heap)
+        while heap:
+            expires, session_id = heap[0]
+            session = self._sessions.get(session_id)
+            if session is not None and session['expires'] == expires:
+                over_limit = self.max_sessions and len(self._sessions) > self.max_sessions
+                if expires > now and not over_limit:
+                    break
+                del self._sessions[session_id]
+            heapq.heappop(heap)
+
+class SQLiteSessionStore:
+    """Sessions kept in a SQLite file so all worker processes share them.
+
+    Same expiry, size limit and sliding renewal as MemorySessionStore;
+    expired and excess sessions are purged whenever a session is stored.
+    """
+
+    def __init__(self, path, ttl=3600, max_sessions=10000, sliding=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sliding = sliding
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                role TEXT NOT NULL,
+                expires REAL NOT NULL
+            )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, session_id):
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT id, username, role, expires FROM sessions WHERE id = ?', (session_id,)
+        ).fetchone()
+        if not row:
+            return None
+        session = {'id': row[0], 'username': row[1], 'role': row[2], 'expires': row[3]}
+        now = time.time()
+        if session['expires'] <= now:
+            self.delete(session_id)
+            return None
+        if self.sliding and session['expires'] - now < self.ttl / 2:
+            session['expires'] = now + self.ttl
+            conn.execute('UPDATE sessions SET expires = ? WHERE id = ?', (session['expires'], session_id))
+        return session
+
+    def set(self, session):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (id, username, role, expires) VALUES (?, ?, ?, ?)',
+                (session['id'], session['username'], session['role'], session['expires'])
+            )
+            conn.execute('DELETE FROM sessions WHERE expires <= ?', (time.time(),))
+            if self.max_sessions:
+                conn.execute(
+                    'DELETE FROM sessions WHERE id IN '
+                    '(SELECT id FROM sessions ORDER BY expires DESC LIMIT -1 OFFSET ?)',
+                    (self.max_sessions,)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def delete(self, session_id):
+        self._connect().execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+
+    def count(self):
+        """Number of unexpired sessions"""
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM sessions WHERE expires > ?', (time.time(),)
+        ).fetchone()[0]
 
 class CertHandler(BaseHTTPRequestHandler):
-    # Class-level session storage
-    sessions = {}
-    
-    def generate_cert_number(self, cert_type_year, cert_type_number, issue_date):
-        """Generate certificate number in format: CV24-001-241121"""
-        year_suffix = str(cert_type_year)[-2:]  # Get last 2 digits of year
-        number_formatted = f"{cert_type_number:03d}"  # Format number as 3 digits with leading zeros
-        date_formatted = issue_date.strftime("%y%m%d")  # Format date as YYMMDD
-        return f"CV{year_suffix}-{number_formatted}-{date_formatted}"
+    # Class-level session storage, replaced by a shared store in prefork mode
+    sessions = MemorySessionStore()
+    # Bearer token required for /metrics; None leaves it open
+    metrics_token = None
+    # Scheme and host that QR codes link to, set by run_server
+    public_url = 'http://localhost:5000'
+
+    def parse_request(self):
+        self.request_started = time.perf_counter()
+        self.response_status = None
+        http_in_flight.inc()
+        # send_error() may already need the id while the request is parsed
+        timing = request_phases.start(request_id())
+        self.request_id = timing.request_id
+        parsed = super().parse_request()
+        timing.phases['parse'] = time.perf_counter() - self.request_started
+        if parsed and self.headers.get('X-Request-ID'):
+            timing.request_id = self.request_id = request_id(self.headers['X-Request-ID'])
+        self.wfile = TimedWriter(self.wfile, request_phases)
+        if parsed:
+            self.request_profile = profiler.begin()
+        return parsed
+
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+        if self.request_started is not None:
+            self.send_header('X-Request-ID', self.request_id)
+
+    def handle_one_request(self):
+        self.request_started = None
+        self.request_profile = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self.request_started is not None:
+                duration = time.perf_counter() - self.request_started
+                method = self.command if self.command in METRIC_METHODS else 'other'
+                route = route_label(getattr(self, 'path', ''))
+                if self.request_profile is not None:
+                    profiler.end(self.request_profile, f'{method} {route}')
+                http_in_flight.dec()
+                http_duration.observe(duration, (method, route))
+                # No status: the handler raised or had no route for the path
+                status = str(self.response_status or 'none')
+                http_requests.inc((method, route, status))
+                slow_requests.record(request_phases.finish(), method, route, status, duration)
+                if isinstance(self.wfile, TimedWriter):
+                    self.wfile = self.wfile.stream
+
+    def serve_qr(self, name):
+        """QR code linking to /verify/<cert_number>, for /qr/<cert_number>.png or .svg"""
+        cert_number, _, image_format = name.rpartition('.')
+        certificate_index.refresh(full=False)
+        if (image_format not in QR_CONTENT_TYPES or not certificate_filter.might_contain(cert_number)
+                or certificate_index.get(cert_number) is None):
+            self.send_error(404)
+            return
+        with request_phases.phase('render'):
+            body, key = qr_images.get(verify_url(self.public_url, cert_number), image_format)
+        etag = f'"{key}"'
+        if etag_matches(etag, self.headers.get('If-None-Match')):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-type', QR_CONTENT_TYPES[image_format])
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'public, max-age=86400')
+        self.end_headers()
+        self.wfile.write(body)
 
+    def serve_metrics(self):
+        if self.metrics_token and not secrets.compare_digest(
+                self.headers.get('Authorization', ''), f'Bearer {self.metrics_token}'):
+            self.send_response(401)
+            self.send_header('WWW-Authenticate', 'Bearer')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = metrics.render()
+        self.send_response(200)
+        self.send_header('Content-type', METRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
     def get_session(self):
         cookie = SimpleCookie(self.headers.get('Cookie'))
         session_id = cookie.get('session_id')
@@ -37,9 +868,9 @@ class CertHandler(BaseHTTPRequestHandler):
             'id': session_id,
             'username': admin_data['username'],
             'role': admin_data['role'],
-            'expires': time.time() + 3600,  # 1 hour expiry
+            'expires': time.time() + self.sessions.ttl,
         }
-        self.sessions[session_id] = session
+        self.sessions.set(session)
         
         # Set secure cookie
         cookie = SimpleCookie()
@@ -50,6 +881,24 @@ class CertHandler(BaseHTTPRequestHandler):
         cookie['session_id']['path'] = '/'
         return cookie
 
+    def send_busy(self, status, retry_after, message):
+        """Reject a request that should be retried later (429/503 with Retry-After)"""
+        body = message.encode()
+        self.send_response(status)
+        self.send_header('Retry-After', str(max(1, int(retry_after + 0.999))))
+        self.send_header('Content-type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def check_rate_limit(self, route):
+        """Take a token for route; answer 429 and return False when the client is over its limit"""
+        retry_after = verify_limiter.acquire(route, self.client_address[0], self.headers.get('X-API-Key'))
+        if retry_after:
+            self.send_busy(429, retry_after, 'Rate limit exceeded')
+            return False
+        return True
+
     def require_auth(self):
         session = self.get_session()
         if not session:
@@ -59,24 +908,49 @@ class CertHandler(BaseHTTPRequestHandler):
             return False
         return True
 
-    def serve_file(self, path, content_type):
-        try:
-            with open(path, 'rb') as file:
-                content = file.read()
-            self.send_response(200)
-            self.send_header('Content-type', content_type)
-            self.end_headers()
-            self.wfile.write(content)
-        except FileNotFoundError:
+    def serve_file(self, path):
+        asset = static_files.lookup(path, self.headers.get('Accept-Encoding', ''))
+        if asset is None:
             self.send_error(404)
+            return
+        not_modified = asset.matches(self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since'))
+        if not_modified:
+            self.send_response(304)
+        else:
+            self.send_response(200)
+            self.send_header('Content-type', asset.content_type)
+            self.send_header('Content-Length', str(asset.size))
+            if asset.encoding:
+                self.send_header('Content-Encoding', asset.encoding)
+        self.send_header('ETag', asset.etag)
+        self.send_header('Last-Modified', asset.last_modified)
+        self.send_header('Cache-Control', f'public, max-age={static_files.max_age}')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        if not_modified:
+            return
 
-    def load_template(self, template_name):
-        with open(f'templates/{template_name}', 'r') as file:
-            return file.read()
+        if asset.body is not None:
+            self.wfile.write(asset.body)
+            return
+        try:
+            with open(asset.path, 'rb') as file:
+                connection = getattr(self, 'connection', None)
+                if connection is not None:
+                    # Zero-copy from the page cache to the socket
+                    with request_phases.phase('write'):
+                        connection.sendfile(file, 0, asset.size)
+                else:
+                    while True:
+                        chunk = file.read(65536)
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+        except OSError as e:
+            print(f"Error sending {asset.path}: {e}")
+            self.close_connection = True
 
     def generate_verification_html(self, cert_data, status):
-        template = self.load_template('verify.html')
-        
         if status == 'valid':
             icon = "verified"
             message = "Valid Certificate"
@@ -105,44 +979,41 @@ class CertHandler(BaseHTTPRequestHandler):
                 </div>
             '''
             
-        return template.replace('{{CONTENT}}', content)
+        return render_page('verify.html', CONTENT=content)
 
     def verify_certificate(self, cert_number, last_name=None, first_name=None):
         try:
-            with open('data/certificates.json', 'r') as file:
-                data = json.load(file)
-            
-            for cert in data['certificates']:
-                if cert['cert_number'] == cert_number:
-                    # If names are provided, verify them
-                    if last_name and first_name:
-                        cert_last_name = cert['owner'].split()[-1].lower()
-                        cert_first_name = cert['owner'].split()[0].lower()
-                        if cert_last_name != last_name.lower() or cert_first_name != first_name.lower():
-                            return {
-                                'found': False,
-                                'valid': False,
-                                'status': 'invalid',
-                                'message': 'Name does not match certificate owner'
-                            }
-                    
-                    valid = datetime.strptime(cert['expire_date'], '%Y-%m-%d') > datetime.now()
+            record = certificate_index.get(cert_number)
+            if record is None:
+                # Callers consult certificate_filter first
+                certificate_filter.record_false_positive()
+                return dict(NOT_FOUND_RESULT)
+
+            cert = record.to_dict()
+            # If names are provided, verify them
+            if last_name and first_name:
+                owner_first, owner_last = record.owner_names()
+                if owner_last != last_name.lower() or owner_first != first_name.lower():
                     return {
-                        'found': True,
-                        'valid': valid,
-                        'status': 'valid' if valid else 'expired',
-                        'data': cert if valid else {
-                            'message': 'Certificate has expired',
-                            'cert_number': cert['cert_number'],
-                            'expire_date': cert['expire_date']
-                        }
+                        'found': False,
+                        'valid': False,
+                        'status': 'invalid',
+                        'message': 'Name does not match certificate owner'
                     }
-            
+
+            if record.expires is None:
+                # Reports why the date did not parse
+                datetime.strptime(cert['expire_date'], '%Y-%m-%d')
+            valid = record.expires > date.today().toordinal()
             return {
-                'found': False,
-                'valid': False,
-                'status': 'invalid',
-                'message': 'Certificate not found'
+                'found': True,
+                'valid': valid,
+                'status': 'valid' if valid else 'expired',
+                'data': cert if valid else {
+                    'message': 'Certificate has expired',
+                    'cert_number': cert['cert_number'],
+                    'expire_date': cert['expire_date']
+                }
             }
         except Exception as e:
             return {
@@ -152,9 +1023,67 @@ class CertHandler(BaseHTTPRequestHandler):
                 'message': f'Error: {str(e)}'
             }
 
+    def serve_verification(self, cert_number, last_name, first_name, kind):
+        """Send a verification result as HTML or JSON, from the cache when possible"""
+        certificate_index.refresh(full=False)
+        if not certificate_filter.might_contain(cert_number):
+            # Never issued: one shared response, so enumeration does not
+            # push real certificates out of the cache
+            key = (None, None, None, kind)
+            response = verification_cache.get(key)
+            if response is None:
+                generation = verification_cache.generation
+                body, content_type = self.render_verification(NOT_FOUND_RESULT, kind)
+                response = verification_cache.build(body, content_type)
+                verification_cache.put(key, response, generation)
+            self.send_verification(response)
+            return
+
+        key = (cert_number, last_name, first_name, kind)
+        response = verification_cache.get(key)
+        if response is None:
+            generation = verification_cache.generation
+            result = self.verify_certificate(cert_number, last_name, first_name)
+            body, content_type = self.render_verification(result, kind)
+            valid_until = None
+            if result['valid']:
+                record = certificate_index.get(cert_number)
+                valid_until = (datetime.fromordinal(record.expires).timestamp()
+                               if record and record.expires else time.time())
+            response = verification_cache.build(body, content_type, valid_until)
+            # Unexpected failures are not cached
+            if not result.get('message', '').startswith('Error:'):
+                verification_cache.put(key, response, generation)
+        self.send_verification(response)
+
+    def render_verification(self, result, kind):
+        """Return (body, content type) for a verify_certificate result"""
+        with request_phases.phase('render'):
+            if kind == 'json':
+                return json.dumps(result).encode(), 'application/json'
+            body = self.generate_verification_html(
+                result.get('data', {'message': result.get('message')}),
+                result['status']
+            )
+            return body, 'text/html'
+
+    def send_verification(self, response):
+        if etag_matches(response.etag, self.headers.get('If-None-Match')):
+            self.send_response(304)
+            self.send_header('ETag', response.etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-type', response.content_type)
+        self.send_header('Content-Length', str(len(response.body)))
+        self.send_header('ETag', response.etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(response.body)
+
     def remove_session(self, session_id):
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        self.sessions.delete(session_id)
         
         cookie = SimpleCookie()
         cookie['session_id'] = ''
@@ -172,12 +1101,16 @@ class CertHandler(BaseHTTPRequestHandler):
 
     def do_GET(self):
         # Public routes
+        if self.path == '/metrics':
+            self.serve_metrics()
+            return
+
         if self.path == '/admin/login':
-            content = self.load_template('admin_login.html')
+            content = render_page('admin_login.html')
             self.send_response(200)
             self.send_header('Content-type', 'text/html')
             self.end_headers()
-            self.wfile.write(content.encode())
+            self.wfile.write(content)
             return
 
         # Protected routes
@@ -188,9 +1121,25 @@ class CertHandler(BaseHTTPRequestHandler):
             if self.path == '/admin/dashboard':
                 self.serve_dashboard()
                 return
-            elif self.path == '/admin/certificates':
+            elif self.path.split('?')[0] == '/admin/certificates':
                 self.serve_certificates()
                 return
+            elif self.path.split('?')[0] == '/admin/api/certificates':
+                self.serve_certificate_listing()
+                return
+            elif self.path.split('?')[0] == '/admin/api/search':
+                self.serve_search()
+                return
+            elif self.path == '/admin/api/slow-requests':
+                self.serve_slow_requests()
+                return
+            elif self.path.split('?')[0] in ('/admin/api/profiler', '/admin/api/profiler/profile'):
+                self.serve_profiler()
+                return
+            elif self.path == '/admin/api/lookup-filter':
+                certificate_index.refresh()
+                self.send_json(certificate_filter.stats())
+                return
             elif self.path == '/admin/certificates/new':
                 self.serve_certificate_form()
                 return
@@ -204,24 +1153,30 @@ class CertHandler(BaseHTTPRequestHandler):
 
         # Serve static files
         if self.path.startswith('/static/'):
-            file_path = self.path[1:]
-            if file_path.endswith('.css'):
-                self.serve_file(file_path, 'text/css')
-            elif file_path.endswith('.js'):
-                self.serve_file(file_path, 'text/javascript')
+            path = urllib.parse.urlparse(self.path).path
+            self.serve_file(urllib.parse.unquote(path[len('/static/'):]))
             return
 
         # Serve main page
         if self.path == '/':
-            content = self.load_template('index.html')
+            content = render_page('index.html')
             self.send_response(200)
             self.send_header('Content-type', 'text/html')
             self.end_headers()
-            self.wfile.write(content.encode())
+            self.wfile.write(content)
+            return
+
+        if self.path.startswith('/qr/'):
+            if not self.check_rate_limit('qr'):
+                return
+            path = urllib.parse.urlparse(self.path).path
+            self.serve_qr(urllib.parse.unquote(path[len('/qr/'):]))
             return
 
         # Handle direct certificate verification (QR code or form redirect)
         if self.path.startswith('/verify/'):
+            if not self.check_rate_limit('verify'):
+                return
             parsed_path = urllib.parse.urlparse(self.path)
             cert_number = parsed_path.path.split('/verify/')[1]
             query_params = urllib.parse.parse_qs(parsed_path.query)
@@ -231,20 +1186,13 @@ class CertHandler(BaseHTTPRequestHandler):
             first_name = query_params.get('firstName', [''])[0]
             
             # Verify certificate with names if provided
-            result = self.verify_certificate(cert_number, last_name, first_name)
-            
-            html = self.generate_verification_html(
-                result.get('data', {'message': result.get('message')}),
-                result['status']
-            )
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(html.encode())
+            self.serve_verification(cert_number, last_name, first_name, 'html')
             return
 
         # Handle API requests
         if self.path.startswith('/api/verify/'):
+            if not self.check_rate_limit('api'):
+                return
             parsed_path = urllib.parse.urlparse(self.path)
             cert_number = parsed_path.path.split('/api/verify/')[1]
             query_params = urllib.parse.parse_qs(parsed_path.query)
@@ -252,24 +1200,10 @@ class CertHandler(BaseHTTPRequestHandler):
             last_name = query_params.get('lastName', [''])[0]
             first_name = query_params.get('firstName', [''])[0]
             
-            result = self.verify_certificate(cert_number, last_name, first_name)
-            
             # Check if the client accepts JSON
             accepts = self.headers.get('Accept', '')
-            if 'application/json' in accepts:
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps(result).encode())
-            else:
-                html = self.generate_verification_html(
-                    result.get('data', {'message': result.get('message')}),
-                    result['status']
-                )
-                self.send_response(200)
-                self.send_header('Content-type', 'text/html')
-                self.end_headers()
-                self.wfile.write(html.encode())
+            kind = 'json' if 'application/json' in accepts else 'html'
+            self.serve_verification(cert_number, last_name, first_name, kind)
             return
 
         # Add this at the start of do_GET
@@ -298,7 +1232,7 @@ class CertHandler(BaseHTTPRequestHandler):
             self.serve_certificate_form(cert_number)
             return
         elif self.path == '/admin/certificates':
-            self.serve_certificates_list()
+            self.serve_certificates()
             return
 
         # Admin management routes - require admin role
@@ -319,7 +1253,139 @@ class CertHandler(BaseHTTPRequestHandler):
                 self.serve_admins_list()
                 return
 
+    def iter_request_body(self, chunk_size=65536):
+        """Yield the request body in pieces (Content-Length or chunked encoding)"""
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    # Skip trailers up to the terminating blank line
+                    while self.rfile.readline().strip():
+                        pass
+                    return
+                yield self.rfile.read(size)
+                self.rfile.readline()
+        remaining = int(self.headers.get('Content-Length') or 0)
+        while remaining > 0:
+            chunk = self.rfile.read(min(chunk_size, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+    def write_chunk(self, data):
+        """Write one chunk of a Transfer-Encoding: chunked response"""
+        self.wfile.write(f'{len(data):X}\r\n'.encode() + data + b'\r\n')
+
+    def start_chunked_response(self, content_type='application/x-ndjson'):
+        # Chunked transfer encoding needs an HTTP/1.1 status line
+        self.protocol_version = 'HTTP/1.1'
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+    def end_chunked_response(self):
+        self.wfile.write(b'0\r\n\r\n')
+
+    def serve_batch_verification(self, flush_size=16384):
+        """Verify a JSON array / NDJSON stream of entries, streaming NDJSON results"""
+        self.start_chunked_response()
+
+        pending = []
+        pending_size = 0
+        client_ip = self.client_address[0]
+        api_key = self.headers.get('X-API-Key')
+        # Once per batch, so the filter knows about certificates added since
+        # the last lookup, as in serve_verification
+        certificate_index.refresh(full=False)
+        try:
+            for entry in iter_json_items(self.iter_request_body()):
+                retry_after = verify_limiter.acquire('batch', client_ip, api_key)
+                if retry_after:
+                    pending.append(json.dumps({
+                        'error': 'Rate limit exceeded',
+                        'retry_after': max(1, int(retry_after + 0.999))
+                    }).encode() + b'\n')
+                    self.close_connection = True
+                    break
+                if isinstance(entry, dict) and entry.get('cert_number'):
+                    cert_number = str(entry['cert_number'])
+                    if certificate_filter.might_contain(cert_number):
+                        result = self.verify_certificate(
+                            cert_number, entry.get('lastName'), entry.get('firstName'))
+                    else:
+                        result = NOT_FOUND_RESULT
+                else:
+                    cert_number = entry.get('cert_number') if isinstance(entry, dict) else None
+                    result = {
+                        'found': False,
+                        'valid': False,
+                        'status': 'invalid',
+                        'message': 'Missing cert_number'
+                    }
+                line = json.dumps({'cert_number': cert_number, **result}).encode() + b'\n'
+                pending.append(line)
+                pending_size += len(line)
+                if pending_size >= flush_size:
+                    self.write_chunk(b''.join(pending))
+                    pending, pending_size = [], 0
+        except ValueError as e:
+            # Headers are already out, so report the problem in-band
+            pending.append(json.dumps({'error': str(e)}).encode() + b'\n')
+        if pending:
+            self.write_chunk(b''.join(pending))
+        self.end_chunked_response()
+
+    def serve_certificate_import(self):
+        """Stream-import CSV/NDJSON certificates, reporting progress and row errors as NDJSON"""
+        query_params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        data_format = query_params.get('format', [''])[0]
+        if data_format not in ('csv', 'ndjson'):
+            content_type = self.headers.get('Content-Type', '')
+            data_format = 'csv' if 'csv' in content_type else 'ndjson'
+        try:
+            batch_size = max(1, int(query_params.get('batch_size', ['1000'])[0]))
+        except ValueError:
+            batch_size = 1000
+
+        self.start_chunked_response()
+
+        def report(record):
+            self.write_chunk(json.dumps(record).encode() + b'\n')
+
+        def on_progress(counts):
+            certificate_index.invalidate()
+            report({'progress': counts})
+
+        importer = CertificateImporter(
+            store, generate_cert_number, batch_size,
+            on_error=lambda row, errors: report({'row': row, 'errors': errors}),
+            on_progress=on_progress
+        )
+        try:
+            stream = io.BufferedReader(ChunkReader(self.iter_request_body()))
+            counts = importer.run(open_rows(stream, data_format))
+            report({'summary': counts})
+        except Exception as e:
+            print(f"Import error: {e}")
+            report({'error': str(e), 'summary': importer.counts})
+        self.end_chunked_response()
+
     def do_POST(self):
+        if self.path == '/api/verify/batch':
+            if not self.check_rate_limit('batch'):
+                return
+            self.serve_batch_verification()
+            return
+
+        if self.path == '/admin/api/profiler':
+            if self.require_auth():
+                self.serve_profiler_switch()
+            return
+
         if self.path == '/admin/login':
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length).decode('utf-8')
@@ -328,27 +1394,30 @@ class CertHandler(BaseHTTPRequestHandler):
             username = form_data.get('username', [''])[0]
             password = form_data.get('password', [''])[0]
             
+            retry_after = login_throttle.acquire(f'user:{username}', f'ip:{self.client_address[0]}')
+            if retry_after:
+                self.send_busy(429, retry_after, 'Too many login attempts, try again later')
+                return
+            
             try:
-                with open('data/admin.json', 'r') as f:
-                    admins = json.load(f)
-                
-                for admin in admins['administrators']:
-                    if admin['username'] == username:
-                        if check_password_hash(admin['password_hash'], password):
-                            # Create session
-                            cookie = self.create_session(admin)
-                            
-                            self.send_response(302)
-                            self.send_header('Set-Cookie', cookie['session_id'].OutputString())
-                            self.send_header('Location', '/admin/dashboard')
-                            self.end_headers()
-                            return
+                admin = store.get_admin(username)
+                if admin and password_pool.check(admin['password_hash'], password):
+                    # Create session
+                    cookie = self.create_session(admin)
+                    
+                    self.send_response(302)
+                    self.send_header('Set-Cookie', cookie['session_id'].OutputString())
+                    self.send_header('Location', '/admin/dashboard')
+                    self.end_headers()
+                    return
                 
                 # Invalid credentials
                 self.send_response(302)
                 self.send_header('Location', '/admin/login?error=1')
                 self.end_headers()
                 
+            except PasswordPoolBusy:
+                self.send_busy(503, 1, 'Server busy, try again later')
             except Exception as e:
                 print(f"Login error: {e}")
                 self.send_response(500)
@@ -363,10 +1432,6 @@ class CertHandler(BaseHTTPRequestHandler):
             form_data = urllib.parse.parse_qs(post_data)
             
             try:
-                # Load existing admins
-                with open('data/admin.json', 'r') as f:
-                    admins = json.load(f)
-                
                 # Get form data
                 username = form_data.get('username', [''])[0]
                 password = form_data.get('password', [''])[0]
@@ -377,20 +1442,19 @@ class CertHandler(BaseHTTPRequestHandler):
                     self.send_error(400, 'Username and password are required')
                     return
                 
-                # Check if username already exists
-                if any(admin['username'] == username for admin in admins['administrators']):
-                    self.send_error(400, 'Username already exists')
-                    return
-                
                 # Ensure only admins can create admin accounts
                 session = self.get_session()
                 if role == 'admin' and session['role'] != 'admin':
                     self.send_error(403, 'Insufficient permissions to create admin accounts')
                     return
                 
+                # Check if username already exists
+                if store.get_admin(username):
+                    self.send_error(400, 'Username already exists')
+                    return
+                
                 # Create password hash
-                from werkzeug.security import generate_password_hash
-                password_hash = generate_password_hash(password, method='scrypt')
+                password_hash = password_pool.hash(password)
                 
                 # Create new admin
                 new_admin = {
@@ -399,22 +1463,27 @@ class CertHandler(BaseHTTPRequestHandler):
                     'role': role
                 }
                 
-                # Add new admin
-                admins['administrators'].append(new_admin)
-                
-                # Save updated admins
-                with open('data/admin.json', 'w') as f:
-                    json.dump(admins, f, indent=4)
+                # Add new admin (fails if the username was taken meanwhile)
+                if not store.add_admin(new_admin):
+                    self.send_error(400, 'Username already exists')
+                    return
                 
                 # Redirect to admins list
                 self.send_response(302)
                 self.send_header('Location', '/admin/admins')
                 self.end_headers()
                 
+            except PasswordPoolBusy:
+                self.send_busy(503, 1, 'Server busy, try again later')
             except Exception as e:
                 print(f"Error creating admin: {e}")
                 self.send_error(500, str(e))
                 
+        elif self.path.split('?')[0] == '/admin/certificates/import':
+            if not self.require_auth():
+                return
+            self.serve_certificate_import()
+
         elif self.path == '/admin/certificates/new':
             if not self.require_auth():
                 return
@@ -427,60 +1496,24 @@ class CertHandler(BaseHTTPRequestHandler):
                 # Get the current date for the certificate number
                 issue_date = datetime.now()
                 
-                # Load existing certificates to get the next number
-                with open('data/certificates.json', 'r') as f:
-                    certs = json.load(f)
-                
-                # Calculate the next certificate number
+                # Allocate the next certificate number for this year
                 current_year = datetime.now().year
-                year_certs = [c for c in certs['certificates'] 
-                             if c['cert_type']['year'] == current_year]
-                next_number = len(year_certs) + 1
+                next_number = store.allocate_number(current_year)
                 
                 # Generate the certificate number
-                cert_number = self.generate_cert_number(
+                cert_number = generate_cert_number(
                     current_year,
                     next_number,
                     issue_date
                 )
                 
-                # Handle phone number (can be null)
-                phone = form_data.get('contact[phone]', [''])[0]
-                if not phone or phone.strip() == '':
-                    phone = "null"
-                
                 # Create new certificate
-                new_cert = {
-                    'cert_number': cert_number,  # Automatically generated
-                    'cert_type': {
-                        'type': form_data.get('cert_type[type]', [''])[0],
-                        'year': current_year,  # Use current year
-                        'number': next_number,  # Automatically calculated
-                        'title': form_data.get('cert_type[title]', [''])[0],
-                        'description': form_data.get('cert_type[description]', [''])[0]
-                    },
-                    'owner': form_data.get('owner', [''])[0],
-                    'birthdate': form_data.get('birthdate', [''])[0],
-                    'address': {
-                        'street': form_data.get('address[street]', [''])[0],
-                        'no': form_data.get('address[no]', [''])[0],
-                        'city': form_data.get('address[city]', [''])[0],
-                        'zip': form_data.get('address[zip]', [''])[0]
-                    },
-                    'contact': {
-                        'phone': phone,  # Can be "null"
-                        'email': form_data.get('contact[email]', [''])[0]
-                    },
-                    'expire_date': form_data.get('expire_date', [''])[0],
-                    'is_valid': True
-                }
+                fields = {key: values[0] for key, values in form_data.items()}
+                new_cert = build_certificate(fields, cert_number, current_year, next_number)
                 
                 # Add new certificate
-                certs['certificates'].append(new_cert)
-                
-                # Save updated certificates
-                with open('data/certificates.json', 'w') as f:
-                    json.dump(certs, f, indent=4)
+                store.add_certificate(new_cert)
+                certificate_index.invalidate()
                 
                 # Redirect to certificates list
                 self.send_response(302)
@@ -504,49 +1537,42 @@ class CertHandler(BaseHTTPRequestHandler):
             form_data = urllib.parse.parse_qs(put_data)
             
             try:
-                with open('data/certificates.json', 'r') as f:
-                    certs = json.load(f)
-                
-                # Find the certificate to update
-                cert_index = next((i for i, cert in enumerate(certs['certificates']) 
-                             if cert['cert_number'] == cert_number), None)
-                
-                if cert_index is not None:
-                    # Preserve existing cert_type fields
-                    existing_cert = certs['certificates'][cert_index]
-                    
-                    # Update certificate data
-                    updated_cert = {
-                        'cert_number': cert_number,  # Keep original number
-                        'cert_type': {
-                            'type': form_data.get('cert_type[type]', [''])[0],
-                            'year': existing_cert['cert_type']['year'],  # Preserve year
-                            'number': existing_cert['cert_type']['number'],  # Preserve number
-                            'title': form_data.get('cert_type[title]', [''])[0],
-                            'description': form_data.get('cert_type[description]', [''])[0]
-                        },
-                        'owner': form_data.get('owner', [''])[0],
-                        'birthdate': form_data.get('birthdate', [''])[0],
-                        'address': {
-                            'street': form_data.get('address[street]', [''])[0],
-                            'no': form_data.get('address[no]', [''])[0],
-                            'city': form_data.get('address[city]', [''])[0],
-                            'zip': form_data.get('address[zip]', [''])[0]
-                        },
-                        'contact': {
-                            'phone': form_data.get('contact[phone]', [''])[0] or None,
-                            'email': form_data.get('contact[email]', [''])[0]
-                        },
-                        'expire_date': form_data.get('expire_date', [''])[0],
-                        'is_valid': existing_cert['is_valid']  # Preserve validity status
-                    }
+                with store.transaction():
+                    # Find the certificate to update
+                    existing_cert = store.get_certificate(cert_number)
                     
-                    # Update the certificate
-                    certs['certificates'][cert_index] = updated_cert
-                    
-                    # Save updated certificates
-                    with open('data/certificates.json', 'w') as f:
-                        json.dump(certs, f, indent=4)
+                    if existing_cert is not None:
+                        # Update certificate data
+                        updated_cert = {
+                            'cert_number': cert_number,  # Keep original number
+                            'cert_type': {
+                                'type': form_data.get('cert_type[type]', [''])[0],
+                                'year': existing_cert['cert_type']['year'],  # Preserve year
+                                'number': existing_cert['cert_type']['number'],  # Preserve number
+                                'title': form_data.get('cert_type[title]', [''])[0],
+                                'description': form_data.get('cert_type[description]', [''])[0]
+                            },
+                            'owner': form_data.get('owner', [''])[0],
+                            'birthdate': form_data.get('birthdate', [''])[0],
+                            'address': {
+                                'street': form_data.get('address[street]', [''])[0],
+                                'no': form_data.get('address[no]', [''])[0],
+                                'city': form_data.get('address[city]', [''])[0],
+                                'zip': form_data.get('address[zip]', [''])[0]
+                            },
+                            'contact': {
+                                'phone': form_data.get('contact[phone]', [''])[0] or None,
+                                'email': form_data.get('contact[email]', [''])[0]
+                            },
+                            'expire_date': form_data.get('expire_date', [''])[0],
+                            'is_valid': existing_cert['is_valid']  # Preserve validity status
+                        }
+                        
+                        # Update the certificate
+                        store.update_certificate(cert_number, updated_cert)
+                
+                if existing_cert is not None:
+                    certificate_index.invalidate()
                     
                     # Send success response
                     self.send_response(200)
@@ -568,32 +1594,26 @@ class CertHandler(BaseHTTPRequestHandler):
             form_data = urllib.parse.parse_qs(put_data)
             
             try:
-                with open('data/admin.json', 'r') as f:
-                    admins = json.load(f)
+                # Update password only if provided
+                password_hash = None
+                if form_data.get('password', [''])[0]:
+                    password_hash = password_pool.hash(form_data['password'][0])
                 
-                # Find the admin to update
-                admin_index = next((i for i, admin in enumerate(admins['administrators']) 
-                                  if admin['username'] == admin_id), None)
-                
-                if admin_index is not None:
-                    # Update admin data
-                    admin = admins['administrators'][admin_index]
-                    
-                    # Update password only if provided
-                    if form_data.get('password', [''])[0]:
-                        from werkzeug.security import generate_password_hash
-                        admin['password_hash'] = generate_password_hash(
-                            form_data['password'][0], 
-                            method='scrypt'
-                        )
-                    
-                    # Update role
-                    admin['role'] = form_data.get('role', ['admin'])[0]
-                    
-                    # Save updated admins
-                    with open('data/admin.json', 'w') as f:
-                        json.dump(admins, f, indent=4)
+                with store.transaction():
+                    # Find the admin to update
+                    admin = store.get_admin(admin_id)
                     
+                    if admin is not None:
+                        if password_hash:
+                            admin['password_hash'] = password_hash
+                        
+                        # Update role
+                        admin['role'] = form_data.get('role', ['admin'])[0]
+                        
+                        # Save updated admin
+                        store.update_admin(admin_id, admin)
+                
+                if admin is not None:
                     self.send_response(200)
                     self.send_header('Content-Type', 'application/json')
                     self.end_headers()
@@ -601,6 +1621,8 @@ class CertHandler(BaseHTTPRequestHandler):
                 else:
                     self.send_error(404, 'Admin not found')
                     
+            except PasswordPoolBusy:
+                self.send_busy(503, 1, 'Server busy, try again later')
             except Exception as e:
                 print(f"Error updating admin: {e}")
                 self.send_error(500, str(e))
@@ -619,23 +1641,11 @@ class CertHandler(BaseHTTPRequestHandler):
             cert_number = self.path.split('/admin/certificates/delete/')[1]
             
             try:
-                # Load existing certificates
-                with open('data/certificates.json', 'r') as f:
-                    certs = json.load(f)
-                
                 # Find and remove the certificate
-                initial_length = len(certs['certificates'])
-                certs['certificates'] = [c for c in certs['certificates'] 
-                                       if c['cert_number'] != cert_number]
-                
-                # Check if certificate was actually removed
-                if len(certs['certificates']) == initial_length:
+                if not store.delete_certificate(cert_number):
                     self.send_error(404, 'Certificate not found')
                     return
-                
-                # Save updated certificates
-                with open('data/certificates.json', 'w') as f:
-                    json.dump(certs, f, indent=4)
+                certificate_index.invalidate()
                 
                 # Send success response
                 self.send_response(200)
@@ -657,24 +1667,11 @@ class CertHandler(BaseHTTPRequestHandler):
                     self.send_error(403, 'Cannot delete main administrator account')
                     return
                 
-                # Load existing admins
-                with open('data/admin.json', 'r') as f:
-                    admins = json.load(f)
-                
                 # Find and remove the admin
-                initial_length = len(admins['administrators'])
-                admins['administrators'] = [a for a in admins['administrators'] 
-                                         if a['username'] != username]
-                
-                # Check if admin was actually removed
-                if len(admins['administrators']) == initial_length:
+                if not store.delete_admin(username):
                     self.send_error(404, 'Administrator not found')
                     return
                 
-                # Save updated admins
-                with open('data/admin.json', 'w') as f:
-                    json.dump(admins, f, indent=4)
-                
                 # Send success response
                 self.send_response(200)
                 self.send_header('Content-Type', 'application/json')
@@ -687,31 +1684,10 @@ class CertHandler(BaseHTTPRequestHandler):
 
     def serve_dashboard(self):
         try:
-            with open('data/certificates.json', 'r') as f:
-                certs = json.load(f)
-            
-            now = datetime.now()
-            thirty_days = timedelta(days=30)
+            # Statistics are maintained by the certificate index listeners
+            certificate_index.refresh()
+            stats = certificate_stats.snapshot()
             
-            # Calculate statistics
-            total_certs = len(certs['certificates'])
-            valid_certs = 0
-            expiring_soon = 0
-            expired_certs = 0
-            cert_types = set()
-            
-            for cert in certs['certificates']:
-                expire_date = datetime.strptime(cert['expire_date'], '%Y-%m-%d')
-                cert_types.add(cert.get('type', 'Unknown'))
-                
-                if expire_date > now:
-                    valid_certs += 1
-                    if expire_date - now <= thirty_days:
-                        expiring_soon += 1
-                else:
-                    expired_certs += 1
-            
-            content = self.load_template('admin_dashboard.html')
             session = self.get_session()
             
             # Prepare admin button HTML
@@ -722,162 +1698,771 @@ class CertHandler(BaseHTTPRequestHandler):
                 </button>
             ''' if session and session['role'] == 'admin' else ''
             
-            replacements = {
-                '{{total_certs}}': str(total_certs),
-                '{{valid_certs}}': str(valid_certs),
-                '{{expiring_soon}}': str(expiring_soon),
-                '{{expired_certs}}': str(expired_certs),
-                '{{cert_types}}': str(len(cert_types)),
-                '{{ADMIN_BUTTON}}': admin_button
-            }
-            
-            for key, value in replacements.items():
-                content = content.replace(key, value)
+            content = render_page('admin_dashboard.html', ADMIN_BUTTON=admin_button, **stats)
             
             self.send_response(200)
             self.send_header('Content-type', 'text/html')
             self.end_headers()
-            self.wfile.write(content.encode())
+            self.wfile.write(content)
             
         except Exception as e:
             print(f"Dashboard error: {e}")
             self.send_error(500)
 
-    def serve_certificates_list(self):
-        try:
-            with open('data/certificates.json', 'r') as f:
-                certs = json.load(f)
-        
-            session = self.get_session()
-            content = self.load_template('certificates_list.html')
-            
-            # Add admin menu item if user is admin
-            admin_menu_item = '''
-                <li>
-                    <a href="/admin/admins" style="text-decoration: none; color: inherit;">
-                        <i class="material-icons">group</i>
-                        <span>Admins</span>
-                    </a>
-                </li>
-            ''' if session['role'] == 'admin' else ''
-            
-            # Convert certificates data to JSON string and embed it safely
-            certificates_json = json.dumps(certs['certificates'])
-            content = content.replace('{{CERTIFICATES_DATA}}', certificates_json)
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(content.encode())
-        except Exception as e:
-            print(f"Error loading certificates: {e}")
-            self.send_error(500)
-
     def serve_certificate_form(self, cert_number=None):
         try:
-            content = self.load_template('certificate_form.html')
+            values = {}
             if cert_number:
-                with open('data/certificates.json', 'r') as f:
-                    certs = json.load(f)
-                    cert_data = next((c for c in certs['certificates'] 
-                                    if c['cert_number'] == cert_number), None)
-                    if cert_data:
-                        content = content.replace('{{{CERTIFICATE_DATA}}}', 
-                                               json.dumps(cert_data))
+                cert_data = store.get_certificate(cert_number)
+                if cert_data:
+                    values['CERTIFICATE_DATA'] = json.dumps(cert_data)
             else:
-                content = content.replace('{{{CERTIFICATE_DATA}}}', '{}')
+                values['CERTIFICATE_DATA'] = '{}'
+            content = render_page('certificate_form.html', **values)
             
             self.send_response(200)
             self.send_header('Content-type', 'text/html')
             self.end_headers()
-            self.wfile.write(content.encode())
+            self.wfile.write(content)
         except Exception as e:
             print(f"Error serving certificate form: {e}")
             self.send_error(500)
 
     def serve_admin_form(self, admin_id=None):
         try:
-            content = self.load_template('admin_form.html')
+            values = {}
             if admin_id:
-                with open('data/admin.json', 'r') as f:
-                    admins = json.load(f)
-                    admin_data = next((a for a in admins['administrators'] 
-                                     if a['username'] == admin_id), None)
-                    if admin_data:
-                        # Remove sensitive data
-                        admin_data.pop('password_hash', None)
-                        content = content.replace('{{{ADMIN_DATA}}}', 
-                                               json.dumps(admin_data))
+                admin_data = store.get_admin(admin_id)
+                if admin_data:
+                    # Remove sensitive data
+                    admin_data.pop('password_hash', None)
+                    values['ADMIN_DATA'] = json.dumps(admin_data)
             else:
-                content = content.replace('{{{ADMIN_DATA}}}', '{}')
+                values['ADMIN_DATA'] = '{}'
+            content = render_page('admin_form.html', **values)
             
             self.send_response(200)
             self.send_header('Content-type', 'text/html')
             self.end_headers()
-            self.wfile.write(content.encode())
+            self.wfile.write(content)
         except Exception as e:
             print(f"Error serving admin form: {e}")
             self.send_error(500)
 
     def serve_certificates(self):
         try:
-            with open('data/certificates.json', 'r') as f:
-                certs = json.load(f)
-            
-            content = self.load_template('certificates_list.html')
-            # Convert certificates data to JSON string and embed it safely
-            certificates_json = json.dumps(certs['certificates']).replace("'", "\\'")
-            content = content.replace('{{CERTIFICATES_DATA}}', certificates_json)
+            # Certificates are fetched page by page from /admin/api/certificates
+            content = render_page('certificates_list.html')
             
             self.send_response(200)
             self.send_header('Content-type', 'text/html')
             self.end_headers()
-            self.wfile.write(content.encode())
+            self.wfile.write(content)
         except Exception as e:
             print(f"Error loading certificates: {e}")
             self.send_error(500)
 
+    def serve_certificate_listing(self):
+        """JSON page of certificates: sort, cursor, limit, type, year, status, expires_from, expires_to"""
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        params = {name: values[0] for name, values in query.items()}
+        try:
+            certificate_index.refresh()
+            payload = certificate_listing.query(params)
+            status = 200
+        except ValueError as e:
+            payload = {'error': str(e)}
+            status = 400
+        self.send_json(payload, status)
+
+    def serve_search(self):
+        """Ranked search over owner, title, e-mail and city: q, limit, offset, fuzzy"""
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        params = {name: values[0] for name, values in query.items()}
+        try:
+            limit = max(1, min(int(params.get('limit') or 20), 100))
+            offset = max(0, int(params.get('offset') or 0))
+            certificate_index.refresh()
+            total, results = certificate_search.search(
+                params.get('q', ''), limit, offset, params.get('fuzzy', '1') != '0')
+            next_offset = offset + len(results) if offset + len(results) < total else None
+            payload = {
+                'total': total,
+                'results': [{'score': score, 'certificate': cert.to_dict()} for score, cert in results],
+                'next_offset': next_offset
+            }
+            status = 200
+        except ValueError as e:
+            payload = {'error': str(e)}
+            status = 400
+        self.send_json(payload, status)
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def serve_slow_requests(self):
+        """Latest requests slower than the --slow-request threshold, with phase timings"""
+        if self.get_session()['role'] != 'admin':
+            self.send_error(403, 'Only administrators can read the slow-request log')
+            return
+        self.send_json({
+            'threshold_ms': slow_requests.threshold * 1000,
+            'requests': slow_requests.recent()
+        })
+
+    def serve_profiler(self):
+        """Profiler status, or the aggregated profile (?route=, ?format=text|pstats)"""
+        if self.get_session()['role'] != 'admin':
+            self.send_error(403, 'Only administrators can use the profiler')
+            return
+        parsed = urllib.parse.urlparse(self.path)
+        if parsed.path == '/admin/api/profiler':
+            self.send_json(profiler.status())
+            return
+        params = {name: values[0] for name, values in urllib.parse.parse_qs(parsed.query).items()}
+        route = params.get('route') or None
+        report_format = params.get('format', 'text')
+        sort = params.get('sort', 'cumulative')
+        if report_format not in REPORT_FORMATS:
+            self.send_json({'error': f"format must be one of {', '.join(REPORT_FORMATS)}"}, 400)
+            return
+        if sort not in SORT_KEYS:
+            self.send_json({'error': f"sort must be one of {', '.join(SORT_KEYS)}"}, 400)
+            return
+        if report_format == 'pstats':
+            body = profiler.export(route)
+            content_type = 'application/octet-stream'
+        else:
+            report = profiler.report(route, sort)
+            body = report.encode() if report is not None else None
+            content_type = 'text/plain; charset=utf-8'
+        if body is None:
+            self.send_error(404, 'No profiles recorded')
+            return
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if content_type == 'application/octet-stream':
+            self.send_header('Content-Disposition', 'attachment; filename="certverif.prof"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def serve_profiler_switch(self):
+        """Start or stop request sampling: {"fraction": 0.05, "duration": 300, "reset": false}"""
+        session = self.get_session()
+        if session['role'] != 'admin':
+            self.send_error(403, 'Only administrators can use the profiler')
+            return
+        retry_after = profiler_switch_throttle.acquire(session['username'])
+        if retry_after:
+            self.send_busy(429, retry_after, 'Profiler switched too often')
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            options = json.loads(self.rfile.read(length) or b'{}')
+            fraction = float(options.get('fraction', 0.01))
+            duration = min(float(options.get('duration', 300)), MAX_PROFILE_SECONDS)
+            if not 0 <= fraction <= 1 or duration <= 0:
+                raise ValueError('fraction must be within 0-1 and duration positive')
+        except (ValueError, TypeError, AttributeError) as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        profiler.start(fraction, duration, bool(options.get('reset')))
+        if fraction:
+            print(f"Profiler started by {session['username']}: fraction {fraction}, {duration:.0f}s")
+        else:
+            print(f"Profiler stopped by {session['username']}")
+        self.send_json(profiler.status())
+
     def serve_admins_list(self):
         try:
-            with open('data/admin.json', 'r') as f:
-                admins = json.load(f)
+            admins = store.load_admins()
             
-            content = self.load_template('admins_list.html')
             # Remove sensitive data before sending to client
             safe_admins = []
-            for admin in admins['administrators']:
+            for admin in admins:
                 safe_admin = admin.copy()
                 safe_admin.pop('password_hash', None)
                 safe_admins.append(safe_admin)
                 
             admins_json = json.dumps(safe_admins)
-            content = content.replace('{{ADMINS_DATA}}', admins_json)
+            content = render_page('admins_list.html', ADMINS_DATA=admins_json)
             
             self.send_response(200)
             self.send_header('Content-type', 'text/html')
             self.end_headers()
-            self.wfile.write(content.encode())
+            self.wfile.write(content)
         except Exception as e:
             print(f"Error loading admins: {e}")
             self.send_error(500)
 
     def show_error_page(self, message):
         """Show error page with toast notification"""
-        content = self.load_template('error.html')
-        content = content.replace('{{ERROR_MESSAGE}}', message)
+        content = render_page('error.html', ERROR_MESSAGE=message)
         self.send_response(403)
         self.send_header('Content-type', 'text/html')
         self.end_headers()
-        self.wfile.write(content.encode())
+        self.wfile.write(content)
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTPServer that hands connections to a fixed pool of worker threads.
+
+    At most ``workers + queue_depth`` connections are in flight; once the
+    queue is full new connections are answered with 503 right away instead
+    of piling up behind slow clients.
+    """
+
+    def __init__(self, server_address, handler_class, workers=8, queue_depth=64):
+        # Set before binding: a failed bind calls server_close()
+        self.requests = queue.Queue(maxsize=queue_depth)
+        self.workers = []
+        super().__init__(server_address, handler_class)
+        for i in range(workers):
+            worker = threading.Thread(target=self.process_queue, name=f'certverif-worker-{i}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def process_request(self, request, client_address):
+        try:
+            self.requests.put_nowait((request, client_address))
+        except queue.Full:
+            self.reject_request(request)
+
+    def reject_request(self, request):
+        """Backpressure: tell the client to retry instead of queueing it"""
+        try:
+            request.sendall(b'HTTP/1.0 503 Service Unavailable\r\n'
+                            b'Retry-After: 1\r\n'
+                            b'Content-Length: 0\r\n'
+                            b'Connection: close\r\n\r\n')
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def process_queue(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                break
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        for _ in self.workers:
+            self.requests.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5)
+
+class ReusePortHTTPServer(ThreadPoolHTTPServer):
+    """Threaded server whose listening socket is shared via SO_REUSEPORT"""
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+class PreforkSupervisor:
+    """Forks worker processes that share the port and keeps them running.
+
+    Each worker binds its own SO_REUSEPORT socket so the kernel balances
+    connections across processes. Dead workers are restarted; SIGTERM or
+    SIGINT stops all workers and waits for them to finish.
+    """
+
+    def __init__(self, port, processes, workers, queue_depth, shutdown_timeout=10):
+        self.port = port
+        self.processes = processes
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.shutdown_timeout = shutdown_timeout
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+            signal.signal(signal.SIGINT, _raise_keyboard_interrupt)
+            # Each worker counts only its own requests; the label keeps every
+            # worker's series separate, and a restarted worker starts new ones
+            metrics.process_labels = (('worker', str(os.getpid())),)
+            code = 0
+            try:
+                httpd = ReusePortHTTPServer(('', self.port), CertHandler, self.workers, self.queue_depth)
+                try:
+                    httpd.serve_forever()
+                except KeyboardInterrupt:
+                    pass
+                finally:
+                    httpd.server_close()
+            except Exception as e:
+                print(f"Worker {os.getpid()} failed: {e}")
+                code = 1
+            # os._exit skips the atexit hook that would stop the pool's processes
+            password_pool.shutdown()
+            os._exit(code)
+        self.children[pid] = time.monotonic()
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.processes):
+            self.spawn()
+
+        while not self.stopping:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if self.stopping or started is None:
+                continue
+            print(f"Worker {pid} exited with status {status}, restarting")
+            # Avoid a tight fork loop when workers die right after start
+            if time.monotonic() - started < 1:
+                time.sleep(1)
+            self.spawn()
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self.children:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.children.pop(pid, None)
+            elif time.monotonic() > deadline:
+                for pid in self.children:
+                    os.kill(pid, signal.SIGKILL)
+                deadline = float('inf')
+            else:
+                time.sleep(0.1)
+
+class _LoopWriter:
+    """File-like wfile for CertHandler that feeds an asyncio queue.
+
+    Writes block the worker thread until the event loop accepts the chunk,
+    so a slow client throttles the handler instead of buffering everything.
+    """
+
+    def __init__(self, loop, chunks):
+        self.loop = loop
+        self.chunks = chunks
+
+    def write(self, data):
+        if data:
+            asyncio.run_coroutine_threadsafe(self.chunks.put(bytes(data)), self.loop).result()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.chunks.put(None), self.loop).result()
+
+class _RequestBody:
+    """The body of one request, read from the connection as the handler asks for it.
+
+    Content-Length bodies end at their length; chunked bodies are passed on
+    verbatim (CertHandler decodes them) and end after the trailers. A body
+    that breaks off, stalls past the timeout or grows beyond max_size reads
+    as ended early and sets broken, and the connection is then closed.
+    """
+
+    def __init__(self, reader, headers, max_size, timeout):
+        self.reader = reader
+        self.max_size = max_size
+        self.timeout = timeout
+        self.chunked = headers.get(b'transfer-encoding', b'').lower() == b'chunked'
+        self.remaining = 0 if self.chunked else int(headers.get(b'content-length', 0))
+        if self.remaining > max_size:
+            raise ValueError('Request body too large')
+        self.size = 0
+        # Bytes left in the current chunk (with its CRLF), or None between chunks
+        self.chunk_left = None
+        self.trailers = False
+        self.pending = bytearray()
+        self.done = not self.chunked and not self.remaining
+        self.broken = False
+
+    async def _fill(self):
+        """Move the next piece of the body from the connection to pending"""
+        reader = self.reader
+        try:
+            if not self.chunked:
+                data = await asyncio.wait_for(reader.read(min(self.remaining, 65536)), self.timeout)
+                if not data:
+                    raise asyncio.IncompleteReadError(b'', self.remaining)
+                self.remaining -= len(data)
+                self.done = not self.remaining
+            elif self.chunk_left:
+                data = await asyncio.wait_for(reader.read(min(self.chunk_left, 65536)), self.timeout)
+                if not data:
+                    raise asyncio.IncompleteReadError(b'', self.chunk_left)
+                self.chunk_left -= len(data)
+            else:
+                data = await asyncio.wait_for(reader.readuntil(b'\n'), self.timeout)
+                if self.trailers:
+                    self.done = not data.strip()
+                else:
+                    chunk_size = int(data.split(b';')[0].strip() or b'0', 16)
+                    self.size += chunk_size
+                    if self.size > self.max_size:
+                        raise ValueError('Request body too large')
+                    self.trailers = chunk_size == 0
+                    self.chunk_left = chunk_size + 2 if chunk_size else None
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, ValueError):
+            self.done = self.broken = True
+            return
+        self.pending += data
+
+    async def read(self, size=-1):
+        while not self.done and (size < 0 or len(self.pending) < size):
+            await self._fill()
+        size = len(self.pending) if size < 0 else size
+        data = bytes(self.pending[:size])
+        del self.pending[:size]
+        return data
+
+    async def readline(self, limit=-1):
+        while not self.done and b'\n' not in self.pending and (limit < 0 or len(self.pending) < limit):
+            await self._fill()
+        end = self.pending.find(b'\n') + 1 or len(self.pending)
+        if limit >= 0:
+            end = min(end, limit)
+        data = bytes(self.pending[:end])
+        del self.pending[:end]
+        return data
+
+    async def drain(self):
+        """Skip whatever the handler left unread, so the next request can be parsed"""
+        while not self.done:
+            await self._fill()
+            self.pending.clear()
+        self.pending.clear()
+
+class _LoopReader:
+    """File-like rfile for CertHandler: the request head, then its body.
+
+    Body reads block the worker thread while the event loop receives the
+    bytes, so an upload reaches the handler as it arrives instead of being
+    buffered whole first.
+    """
+
+    def __init__(self, loop, head, body):
+        self.loop = loop
+        self.head = io.BytesIO(head)
+        self.body = body
 
-def run_server(port=5000):
+    def _wait(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        data = self.head.read(size)
+        if size < 0:
+            return data + self._wait(self.body.read())
+        if len(data) < size:
+            data += self._wait(self.body.read(size - len(data)))
+        return data
+
+    def readline(self, limit=-1):
+        if limit is None:
+            limit = -1
+        line = self.head.readline(limit)
+        if line.endswith(b'\n') or 0 <= limit <= len(line):
+            return line
+        return line + self._wait(self.body.readline(limit - len(line) if limit >= 0 else -1))
+
+class AsyncHTTPServer:
+    """asyncio front end serving CertHandler routes.
+
+    Connections, keep-alive and request parsing live on the event loop, so
+    idle clients cost no thread. Each parsed request runs CertHandler in a
+    bounded thread pool (scrypt, file I/O); its body is read from the
+    connection as the handler consumes it and the response is streamed
+    back through the loop, so batch verification and imports stream in
+    both directions. Bodies are limited to max_body_size.
+    """
+
+    max_header_size = 65536
+    max_body_size = 64 * 1024 * 1024
+
+    def __init__(self, port, handler_class, workers=8, keepalive_timeout=15):
+        self.port = port
+        self.handler_class = handler_class
+        self.keepalive_timeout = keepalive_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='certverif-async')
+
+    def run_handler(self, rfile, client_address, wfile):
+        handler = self.handler_class.__new__(self.handler_class)
+        handler.server = self
+        handler.request = None
+        handler.client_address = client_address
+        handler.rfile = rfile
+        handler.wfile = wfile
+        try:
+            handler.handle_one_request()
+        finally:
+            wfile.close()
+
+    async def read_request(self, reader):
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.keepalive_timeout)
+        request_line, _, header_block = head.partition(b'\r\n')
+        headers = {}
+        for line in header_block.split(b'\r\n'):
+            name, sep, value = line.partition(b':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        body = _RequestBody(reader, headers, self.max_body_size, self.keepalive_timeout)
+        return request_line, headers, head, body
+
+    def frame_headers(self, head, version, keep_alive):
+        """Rewrite CertHandler's HTTP/1.0 response head for a persistent connection"""
+        status_line, _, header_block = head.partition(b'\r\n')
+        lines = [line for line in header_block.split(b'\r\n') if line]
+        names = {line.partition(b':')[0].strip().lower() for line in lines}
+        framed = b'content-length' in names or b'transfer-encoding' in names
+        if b'connection' in names:
+            keep_alive = keep_alive and not any(
+                line.lower().startswith(b'connection:') and b'close' in line.lower() for line in lines)
+        lines = [line for line in lines if not line.lower().startswith(b'connection:')]
+        lines.append(b'Connection: keep-alive' if keep_alive else b'Connection: close')
+        status_line = version + status_line[status_line.index(b' '):]
+        return status_line, lines, framed, keep_alive
+
+    async def handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        peer = writer.get_extra_info('peername') or ('', 0)
+        client_address = peer[:2]
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request_line, headers, head, request_body = await self.read_request(reader)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except (asyncio.LimitOverrunError, ValueError):
+                    writer.write(b'HTTP/1.1 413 Request Entity Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                    break
+
+                version = b'HTTP/1.1' if request_line.rstrip().endswith(b'HTTP/1.1') else b'HTTP/1.0'
+                connection = headers.get(b'connection', b'').lower()
+                if version == b'HTTP/1.1':
+                    keep_alive = b'close' not in connection
+                else:
+                    keep_alive = b'keep-alive' in connection
+
+                chunks = asyncio.Queue(maxsize=16)
+                job = loop.run_in_executor(self.executor, self.run_handler, _LoopReader(loop, head, request_body),
+                                           client_address, _LoopWriter(loop, chunks))
+
+                head = b''
+                body = []
+                framed = None
+                aborted = False
+                while True:
+                    chunk = await chunks.get()
+                    if chunk is None:
+                        break
+                    if aborted:
+                        # Keep draining so the worker thread is never left blocked
+                        continue
+                    try:
+                        if framed is None:
+                            head += chunk
+                            if b'\r\n\r\n' not in head:
+                                continue
+                            head, _, rest = head.partition(b'\r\n\r\n')
+                            status_line, lines, framed, keep_alive = self.frame_headers(head, version, keep_alive)
+                            if framed:
+                                writer.write(b'\r\n'.join([status_line] + lines) + b'\r\n\r\n' + rest)
+                            else:
+                                body.append(rest)
+                        elif framed:
+                            writer.write(chunk)
+                            await writer.drain()
+                        else:
+                            body.append(chunk)
+                    except ConnectionError:
+                        aborted = True
+                try:
+                    await job
+                except Exception as e:
+                    print(f"Async handler error: {e}")
+                    break
+                if aborted:
+                    break
+                await request_body.drain()
+                if request_body.broken:
+                    keep_alive = False
+
+                if framed is None:
+                    # Handler produced no response (unknown route)
+                    writer.write(version + b' 404 Not Found\r\nContent-Length: 0\r\n\r\n')
+                elif not framed:
+                    # Buffered body: add the Content-Length that keep-alive needs
+                    payload = b''.join(body)
+                    lines.append(f'Content-Length: {len(payload)}'.encode())
+                    writer.write(b'\r\n'.join([status_line] + lines) + b'\r\n\r\n' + payload)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_connection, port=self.port,
+                                            limit=self.max_header_size, reuse_address=True)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except NotImplementedError:
+                pass
+        async with server:
+            await stop.wait()
+        # Let in-flight handlers finish; they need the loop to flush output
+        await loop.run_in_executor(None, self.executor.shutdown)
+
+def run_server(port=5000, mode='single', workers=8, queue_depth=64, processes=4, keepalive_timeout=15,
+               storage='json', database=None, dev=False, session_store='memory', session_ttl=3600,
+               max_sessions=10000, sliding_sessions=False, password_workers=2, password_queue=8,
+               rate_limits=None, api_keys=(), metrics_token=None, slow_request_ms=500, public_url=None):
     server_address = ('', port)
-    httpd = HTTPServer(server_address, CertHandler)
-    print(f'Starting server on port {port}...')
+    configure_store(storage, database)
+    # Built once here, before prefork workers start, when missing or stale
+    if getattr(store, 'record_index', None) and store.record_index() is None:
+        store.build_record_index()
+    # Loads the record index and builds the lookup filter before the first request
+    certificate_index.refresh(full=False)
+    templates.watch = dev
+    password_pool.processes = password_workers
+    password_pool.max_pending = password_queue
+    verify_limiter.configure({**VERIFY_RATE_LIMITS, **(rate_limits or {})})
+    verify_limiter.api_keys = frozenset(api_keys)
+    CertHandler.metrics_token = metrics_token
+    CertHandler.public_url = (public_url or f'http://localhost:{port}').rstrip('/')
+    slow_requests.threshold = slow_request_ms / 1000
+    # Prefork workers must see each other's logins
+    if session_store == 'sqlite' or mode == 'prefork':
+        CertHandler.sessions = SQLiteSessionStore(SESSIONS_DB, session_ttl, max_sessions, sliding_sessions)
+    else:
+        CertHandler.sessions = MemorySessionStore(session_ttl, max_sessions, sliding_sessions)
+    if mode == 'async':
+        print(f'Starting asyncio server on port {port} ({workers} handler threads)...')
+    elif mode == 'prefork':
+        print(f'Starting prefork server on port {port} ({processes} processes x {workers} workers)...')
+    elif mode == 'threaded':
+        httpd = ThreadPoolHTTPServer(server_address, CertHandler, workers, queue_depth)
+        print(f'Starting threaded server on port {port} ({workers} workers, queue depth {queue_depth})...')
+    else:
+        httpd = HTTPServer(server_address, CertHandler)
+        print(f'Starting server on port {port}...')
     print(f'Visit http://localhost:{port} to verify certificates')
     print(f'For QR codes use: http://localhost:{port}/verify/<cert_number>')
+    print(f'QR images link to {CertHandler.public_url}: http://localhost:{port}/qr/<cert_number>.png (or .svg)')
     print(f'For API calls use: curl -H "Accept: application/json" http://localhost:{port}/api/verify/<cert_number>')
-    httpd.serve_forever()
+    try:
+        if mode == 'prefork':
+            PreforkSupervisor(port, processes, workers, queue_depth).run()
+        elif mode == 'async':
+            asyncio.run(AsyncHTTPServer(port, CertHandler, workers, keepalive_timeout).serve())
+        else:
+            # Stop on SIGTERM as on Ctrl-C, so the password pool is shut down
+            signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+            try:
+                httpd.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                httpd.server_close()
+    finally:
+        password_pool.shutdown()
+
+def parse_args(argv=None):
+    env = os.environ
+    parser = argparse.ArgumentParser(description='CertVerif certificate verification server')
+    parser.add_argument('--port', type=int, default=int(env.get('CERTVERIF_PORT', 5000)),
+                        help='port to listen on (env: CERTVERIF_PORT)')
+    parser.add_argument('--mode', choices=['single', 'threaded', 'prefork', 'async'], default=env.get('CERTVERIF_MODE', 'single'),
+                        help='server mode (env: CERTVERIF_MODE)')
+    parser.add_argument('--workers', type=int, default=int(env.get('CERTVERIF_WORKERS', 8)),
+                        help='worker threads per process in threaded/prefork/async mode (env: CERTVERIF_WORKERS)')
+    parser.add_argument('--queue-depth', type=int, default=int(env.get('CERTVERIF_QUEUE_DEPTH', 64)),
+                        help='connections waiting for a worker before new ones get 503 (env: CERTVERIF_QUEUE_DEPTH)')
+    parser.add_argument('--processes', type=int, default=int(env.get('CERTVERIF_PROCESSES', os.cpu_count() or 1)),
+                        help='worker processes in prefork mode (env: CERTVERIF_PROCESSES)')
+    parser.add_argument('--keepalive-timeout', type=float, default=float(env.get('CERTVERIF_KEEPALIVE_TIMEOUT', 15)),
+                        help='seconds an idle keep-alive connection stays open in async mode (env: CERTVERIF_KEEPALIVE_TIMEOUT)')
+    parser.add_argument('--storage', choices=['json', 'journal', 'sqlite'], default=env.get('CERTVERIF_STORAGE', 'json'),
+                        help='storage backend (env: CERTVERIF_STORAGE)')
+    parser.add_argument('--database', default=env.get('CERTVERIF_DATABASE'),
+                        help='SQLite database file for --storage sqlite (env: CERTVERIF_DATABASE)')
+    parser.add_argument('--dev', action='store_true', default=env.get('CERTVERIF_DEV', '') not in ('', '0'),
+                        help='reload templates when they change on disk (env: CERTVERIF_DEV)')
+    parser.add_argument('--session-store', choices=['memory', 'sqlite'], default=env.get('CERTVERIF_SESSION_STORE', 'memory'),
+                        help='where sessions are kept; prefork mode always uses sqlite (env: CERTVERIF_SESSION_STORE)')
+    parser.add_argument('--session-ttl', type=float, default=float(env.get('CERTVERIF_SESSION_TTL', 3600)),
+                        help='session lifetime in seconds (env: CERTVERIF_SESSION_TTL)')
+    parser.add_argument('--max-sessions', type=int, default=int(env.get('CERTVERIF_MAX_SESSIONS', 10000)),
+                        help='sessions kept before the oldest are evicted, 0 for no limit (env: CERTVERIF_MAX_SESSIONS)')
+    parser.add_argument('--sliding-sessions', action='store_true',
+                        default=env.get('CERTVERIF_SLIDING_SESSIONS', '') not in ('', '0'),
+                        help='renew sessions while they are in use (env: CERTVERIF_SLIDING_SESSIONS)')
+    parser.add_argument('--password-workers', type=int, default=int(env.get('CERTVERIF_PASSWORD_WORKERS', 2)),
+                        help='processes for scrypt hashing per server process, 0 to hash inline (env: CERTVERIF_PASSWORD_WORKERS)')
+    parser.add_argument('--password-queue', type=int, default=int(env.get('CERTVERIF_PASSWORD_QUEUE', 8)),
+                        help='password jobs waiting before logins get 503 (env: CERTVERIF_PASSWORD_QUEUE)')
+    parser.add_argument('--rate-limit', action='append', type=parse_limit,
+                        default=[parse_limit(spec) for spec in env.get('CERTVERIF_RATE_LIMITS', '').split(',') if spec.strip()],
+                        metavar='ROUTE=RATE[/BURST]',
+                        help='per-client limit for verify, api, batch or qr in requests per second; 0 disables '
+                             '(repeatable; env: CERTVERIF_RATE_LIMITS, comma separated)')
+    parser.add_argument('--api-keys', default=env.get('CERTVERIF_API_KEYS_FILE'),
+                        help='file with one API key per line; X-API-Key holders get 10x the limits (env: CERTVERIF_API_KEYS_FILE)')
+    parser.add_argument('--metrics-token', default=env.get('CERTVERIF_METRICS_TOKEN'),
+                        help='bearer token required to scrape /metrics; open when unset (env: CERTVERIF_METRICS_TOKEN)')
+    parser.add_argument('--slow-request-ms', type=float, default=float(env.get('CERTVERIF_SLOW_REQUEST_MS', 500)),
+                        help='log requests slower than this with their phase timings, 0 to disable (env: CERTVERIF_SLOW_REQUEST_MS)')
+    parser.add_argument('--public-url', default=env.get('CERTVERIF_PUBLIC_URL'),
+                        help='scheme and host QR codes link to, e.g. https://certs.example.com '
+                             '(default http://localhost:PORT; env: CERTVERIF_PUBLIC_URL)')
+    args = parser.parse_args(argv)
+    args.api_key_list = []
+    if args.api_keys:
+        with open(args.api_keys) as file:
+            args.api_key_list = [line.strip() for line in file if line.strip() and not line.startswith('#')]
+    return args
 
 if __name__ == '__main__':
-    run_server()
+    args = parse_args()
+    run_server(args.port, args.mode, args.workers, args.queue_depth, args.processes, args.keepalive_timeout,
+               args.storage, args.database, args.dev, args.session_store, args.session_ttl,
+               args.max_sessions, args.sliding_sessions, args.password_workers, args.password_queue,
+               dict(args.rate_limit), args.api_key_list, args.metrics_token, args.slow_request_ms,
+               args.public_url)
@@ -0,0 +1,18 @@
+"""Reproducible benchmarks for the CertVerif server.
+
+    # Synthetic data directory (data/certificates.json, data/admin.json)
+    python -m benchmark generate --count 100000 --output bench-data
+
+    # Start app.py on a scratch copy of the data and drive load against it
+    python -m benchmark run --count 10000 --duration 30 --output before.json
+
+    # Per-route latency and throughput changes between two runs
+    python -m benchmark compare before.json after.json
+
+    # Bytes per certificate held by the in-memory indexes
+    python -m benchmark memory --count 100000
+"""
+
+from benchmark.dataset import generate_certificates, write_dataset
+from benchmark.load import BenchmarkServer, LoadDriver, compare_reports
+from benchmark.memory import measure_memory
@@ -0,0 +1,150 @@
+"""Command line entry point: python -m benchmark {generate,run,compare,memory}"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from datetime import date
+
+from benchmark.dataset import write_dataset
+from benchmark.load import (DEFAULT_MIX, BenchmarkServer, LoadDriver, compare_reports, environment,
+                            parse_mix)
+from benchmark.memory import RECORD_TARGET_BYTES, RECORD_TARGET_MIN_COUNT, measure_memory
+
+def load_cert_numbers(dataset_dir):
+    with open(os.path.join(dataset_dir, 'data', 'certificates.json')) as file:
+        return [cert['cert_number'] for cert in json.load(file)['certificates']]
+
+def run(args):
+    with tempfile.TemporaryDirectory(prefix='certverif-dataset-') as scratch:
+        dataset_dir = args.data
+        if dataset_dir is None:
+            print(f'Generating {args.count} certificates...', file=sys.stderr)
+            write_dataset(scratch, args.count, args.seed, args.today)
+            dataset_dir = scratch
+        cert_numbers = load_cert_numbers(dataset_dir)
+
+        print(f'Starting server ({args.mode}, {args.workers} workers)...', file=sys.stderr)
+        with BenchmarkServer(dataset_dir, args.mode, args.workers, args.server_arg) as server:
+            driver = LoadDriver(server.port, cert_numbers, args.mix, args.concurrency, args.seed)
+            driver.login()
+            print(f'Running for {args.duration}s after {args.warmup}s warm-up '
+                  f'with {args.concurrency} clients...', file=sys.stderr)
+            results = driver.run(args.duration, args.warmup)
+
+    report = {
+        'benchmark': {
+            'certificates': len(cert_numbers),
+            'seed': args.seed,
+            'mode': args.mode,
+            'workers': args.workers,
+            'server_args': args.server_arg,
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'mix': driver.mix
+        },
+        'environment': environment(),
+        **results
+    }
+    text = json.dumps(report, indent=2, sort_keys=True) + '\n'
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text)
+    print_summary(report)
+    return 0
+
+def print_summary(report):
+    print(f"{'route':<12} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = list(report['routes'].items()) + [('total', report['total'])]
+    for route, stats in rows:
+        print(f"{route:<12} {stats['requests']:>9} {stats['errors']:>7} {stats['throughput_rps']:>9} "
+              f"{stats['p50_ms'] or '-':>9} {stats['p95_ms'] or '-':>9} {stats['p99_ms'] or '-':>9}")
+
+def compare(args):
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    if baseline.get('benchmark', {}) != current.get('benchmark', {}):
+        print('Warning: the reports were produced with different benchmark settings', file=sys.stderr)
+    rows, regressions = compare_reports(baseline, current, args.threshold)
+    print(f"{'route':<12} {'field':<15} {'baseline':>10} {'current':>10} {'change':>8}")
+    for route, field, old, new, change, worse in rows:
+        change_text = f'{change:+.1%}' if change is not None else '-'
+        marker = '  REGRESSION' if worse else ''
+        print(f"{route:<12} {field:<15} {old if old is not None else '-':>10} "
+              f"{new if new is not None else '-':>10} {change_text:>8}{marker}")
+    return 1 if regressions else 0
+
+def memory(args):
+    sizes = measure_memory(args.count, args.seed, args.today)
+    print(f"{'structure':<12} {'bytes/cert':>10}")
+    for name, size in sizes.items():
+        print(f'{name:<12} {size:>10}')
+    print(f"{'total':<12} {sum(sizes.values()):>10}")
+    if args.count < RECORD_TARGET_MIN_COUNT:
+        print(f'Not checking the target of {args.target} bytes per certificate below '
+              f'{RECORD_TARGET_MIN_COUNT} certificates', file=sys.stderr)
+        return 0
+    if sizes['records'] > args.target:
+        print(f"Records use {sizes['records']} bytes per certificate, over the target of {args.target}",
+              file=sys.stderr)
+        return 1
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description='CertVerif benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = subparsers.add_parser('generate', help='write a synthetic data directory')
+    generate_parser.add_argument('--count', type=int, default=10000, help='certificates to generate (default 10000)')
+    generate_parser.add_argument('--seed', type=int, default=1)
+    generate_parser.add_argument('--today', type=date.fromisoformat,
+                                 help='reference date for issue and expiry dates (YYYY-MM-DD, default today)')
+    generate_parser.add_argument('--output', required=True, help='directory to create data/ in')
+
+    run_parser = subparsers.add_parser('run', help='start the server on a dataset and drive load against it')
+    run_parser.add_argument('--data', help='directory made by generate (default: generate one for this run)')
+    run_parser.add_argument('--count', type=int, default=10000, help='certificates to generate without --data')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--today', type=date.fromisoformat, help='reference date for generated data')
+    run_parser.add_argument('--mode', choices=['single', 'threaded', 'prefork', 'async'], default='threaded')
+    run_parser.add_argument('--workers', type=int, default=8)
+    run_parser.add_argument('--server-arg', action='append', default=[],
+                            help='extra app.py argument, repeatable (e.g. --server-arg=--storage=sqlite)')
+    run_parser.add_argument('--concurrency', type=int, default=8, help='client threads (default 8)')
+    run_parser.add_argument('--duration', type=float, default=30, help='measured seconds (default 30)')
+    run_parser.add_argument('--warmup', type=float, default=3, help='unmeasured seconds first (default 3)')
+    run_parser.add_argument('--mix', type=parse_mix, default=dict(DEFAULT_MIX),
+                            help='route weights, e.g. verify=50,api_verify=50 (routes: %s)' % ', '.join(DEFAULT_MIX))
+    run_parser.add_argument('--output', help='write the JSON report to this file')
+
+    compare_parser = subparsers.add_parser('compare', help='compare two JSON reports')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help='relative change counted as a regression (default 0.10)')
+
+    memory_parser = subparsers.add_parser('memory', help='measure index memory per certificate')
+    memory_parser.add_argument('--count', type=int, default=100000, help='certificates to generate (default 100000)')
+    memory_parser.add_argument('--seed', type=int, default=1)
+    memory_parser.add_argument('--today', type=date.fromisoformat, help='reference date for generated data')
+    memory_parser.add_argument('--target', type=int, default=RECORD_TARGET_BYTES,
+                               help='bytes per certificate the records may use, checked from '
+                                    f'{RECORD_TARGET_MIN_COUNT} certificates (default %(default)s)')
+
+    args = parser.parse_args(argv)
+    if args.command == 'generate':
+        data_dir = write_dataset(args.output, args.count, args.seed, args.today)
+        print(f'Wrote {args.count} certificates to {data_dir}')
+        return 0
+    if args.command == 'run':
+        return run(args)
+    if args.command == 'memory':
+        return memory(args)
+    return compare(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
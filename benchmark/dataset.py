@@ -0,0 +1,115 @@
+"""Synthetic certificate and administrator data in the README's schema.
+
+Output depends only on the count, the seed and the reference date (today
+unless given), so runs generated with the same arguments benchmark the
+same data.
+"""
+
+import json
+import os
+import random
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+BENCHMARK_ADMIN = 'bench'
+BENCHMARK_PASSWORD = 'bench-password'
+
+FIRST_NAMES = [
+    'Anna', 'Ben', 'Clara', 'David', 'Elif', 'Felix', 'Greta', 'Hannes', 'Ines', 'Jonas', 'Katrin',
+    'Lukas', 'Maria', 'Noah', 'Olga', 'Paul', 'Quentin', 'Rosa', 'Sven', 'Tanja', 'Ulrich', 'Vera',
+    'Wojciech', 'Xenia', 'Yusuf', 'Zoë', 'José', 'Søren', 'Łucja', 'Jürgen', 'Amélie', 'Çağla'
+]
+LAST_NAMES = [
+    'Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker', 'Schulz',
+    'Hoffmann', 'Koch', 'Richter', 'Klein', 'Wolf', 'Schröder', 'Neumann', 'Schwarz', 'Zimmermann',
+    'Braun', 'Krüger', 'Hofmann', 'Hartmann', 'Lange', 'García', 'Novák', 'Kowalski', 'Doe', 'Smith',
+    'Nguyen', 'Yılmaz', 'Rossi', 'Dubois'
+]
+CITIES = [
+    ('Berlin', '10115'), ('Hamburg', '20095'), ('München', '80331'), ('Köln', '50667'),
+    ('Frankfurt am Main', '60311'), ('Stuttgart', '70173'), ('Düsseldorf', '40213'), ('Leipzig', '04109'),
+    ('Dortmund', '44135'), ('Essen', '45127'), ('Bremen', '28195'), ('Dresden', '01067'),
+    ('Hannover', '30159'), ('Nürnberg', '90403'), ('Wien', '1010'), ('Zürich', '8001')
+]
+STREETS = [
+    'Hauptstraße', 'Schulstraße', 'Gartenweg', 'Bahnhofstraße', 'Lindenallee', 'Bergstraße',
+    'Kirchplatz', 'Am Markt', 'Rosenweg', 'Main St'
+]
+CERT_TYPES = [
+    ('DC', 'Developer Certificate', 'Software development fundamentals'),
+    ('SC', 'Security Certificate', 'Secure operations and incident response'),
+    ('NC', 'Network Certificate', 'Network administration'),
+    ('PM', 'Project Management', 'Planning and delivery of projects'),
+    ('QA', 'Quality Assurance', 'Testing and quality processes')
+]
+MAIL_DOMAINS = ['example.com', 'example.org', 'test.dom', 'mail.example.net']
+
+def generate_certificates(count, seed=1, today=None):
+    """Yield count certificates, issued over the last eight years.
+
+    Validity periods of one to five years leave a realistic mix of valid,
+    expired and soon-expiring certificates relative to today.
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    first_issue = date(today.year - 7, 1, 1)
+    span = (today - first_issue).days
+    numbers = {}
+    for _ in range(count):
+        issued = first_issue + timedelta(days=rng.randrange(span + 1))
+        number = numbers[issued.year] = numbers.get(issued.year, 0) + 1
+        cert_type, title, description = rng.choice(CERT_TYPES)
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        city, zip_code = rng.choice(CITIES)
+        born = date(1950, 1, 1) + timedelta(days=rng.randrange(50 * 365))
+        expires = issued + timedelta(days=365 * rng.randint(1, 5))
+        yield {
+            'cert_number': f'CV{issued.year % 100:02d}-{number:03d}-{issued:%y%m%d}',
+            'cert_type': {
+                'type': cert_type,
+                'year': issued.year,
+                'number': number,
+                'title': title,
+                'description': description
+            },
+            'owner': f'{first_name} {last_name}',
+            'birthdate': born.isoformat(),
+            'address': {
+                'street': rng.choice(STREETS),
+                'no': str(rng.randint(1, 200)),
+                'city': city,
+                'zip': zip_code
+            },
+            'contact': {
+                'phone': f'+49{rng.randrange(10 ** 9, 10 ** 10)}' if rng.random() < 0.7 else 'null',
+                'email': f'{first_name[0]}.{last_name}{number}@{rng.choice(MAIL_DOMAINS)}'.lower()
+            },
+            'expire_date': expires.isoformat(),
+            'is_valid': rng.random() >= 0.02
+        }
+
+def write_dataset(directory, count, seed=1, today=None, password=BENCHMARK_PASSWORD):
+    """Write data/certificates.json and data/admin.json below directory.
+
+    Certificates are streamed one per line, so a million of them never sit
+    in memory at once. Returns the path of the data directory.
+    """
+    data_dir = os.path.join(directory, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, 'certificates.json'), 'w') as file:
+        file.write('{"certificates": [\n')
+        for position, cert in enumerate(generate_certificates(count, seed, today)):
+            if position:
+                file.write(',\n')
+            file.write(json.dumps(cert))
+        file.write('\n]}\n')
+    admins = {
+        'administrators': [
+            {'username': BENCHMARK_ADMIN, 'password_hash': generate_password_hash(password), 'role': 'admin'}
+        ]
+    }
+    with open(os.path.join(data_dir, 'admin.json'), 'w') as file:
+        json.dump(admins, file, indent=4)
+    return data_dir
@@ -0,0 +1,343 @@
+"""Load driver and latency reports.
+
+BenchmarkServer starts app.py in a child process on a scratch copy of a
+generated dataset; LoadDriver then runs a weighted mix of requests against
+it from a pool of client threads and reports throughput and latency
+percentiles per route.
+"""
+
+import http.client
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+
+from benchmark.dataset import BENCHMARK_ADMIN, BENCHMARK_PASSWORD
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Relative weight of each route in the request mix
+DEFAULT_MIX = {
+    'verify': 35,
+    'api_verify': 35,
+    'dashboard': 5,
+    'listing': 10,
+    'create': 5,
+    'edit': 5,
+    'delete': 5
+}
+
+# Status codes counted as success, per route
+EXPECTED_STATUS = {
+    'verify': (200,),
+    'api_verify': (200,),
+    'dashboard': (200,),
+    'listing': (200,),
+    'create': (302,),
+    'edit': (200,),
+    'delete': (200,)
+}
+
+LISTING_SORTS = ['cert_number', '-expire_date', 'owner', 'year']
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not ordered:
+        return None
+    rank = max(1, int(fraction * len(ordered) + 0.999999))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def parse_mix(spec):
+    """Parse 'verify=50,listing=10' into a request mix"""
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f'Unknown route {name!r}; expected one of {", ".join(DEFAULT_MIX)}')
+        mix[name] = float(weight)
+    return mix
+
+class BenchmarkServer:
+    """app.py running in a child process on a scratch copy of a dataset.
+
+    The scratch directory gets a copy of data/ (create, edit and delete
+    change it) and links to the repository's templates and static files.
+    Rate limits are switched off so that they do not cap the measurement.
+    """
+
+    def __init__(self, dataset_dir, mode='threaded', workers=8, extra_args=(), startup_timeout=300):
+        self.dataset_dir = dataset_dir
+        self.mode = mode
+        self.workers = workers
+        self.extra_args = list(extra_args)
+        self.startup_timeout = startup_timeout
+        self.port = None
+        self.process = None
+        self.workdir = None
+        self.log = None
+
+    def start(self):
+        self.workdir = tempfile.mkdtemp(prefix='certverif-bench-')
+        shutil.copytree(os.path.join(self.dataset_dir, 'data'), os.path.join(self.workdir, 'data'))
+        for name in ('templates', 'static'):
+            os.symlink(os.path.join(REPO_DIR, name), os.path.join(self.workdir, name))
+        self.port = free_port()
+        self.log = open(os.path.join(self.workdir, 'server.log'), 'w')
+        command = [
+            sys.executable, os.path.join(REPO_DIR, 'app.py'),
+            '--port', str(self.port), '--mode', self.mode, '--workers', str(self.workers),
+            '--rate-limit', 'verify=0', '--rate-limit', 'api=0', '--rate-limit', 'batch=0',
+            '--slow-request-ms', '0'
+        ] + self.extra_args
+        self.process = subprocess.Popen(command, cwd=self.workdir, stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'Server exited with status {self.process.returncode}; '
+                                   f'see {self.log.name}')
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError(f'Server did not start within {self.startup_timeout} seconds')
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+            try:
+                self.process.wait(15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.log is not None:
+            self.log.close()
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+class LoadDriver:
+    """Runs a weighted request mix against a server from client threads"""
+
+    def __init__(self, port, cert_numbers, mix=None, concurrency=8, seed=1, timeout=60):
+        self.port = port
+        self.mix = {name: weight for name, weight in (mix or DEFAULT_MIX).items() if weight > 0}
+        self.concurrency = concurrency
+        self.seed = seed
+        self.timeout = timeout
+        rng = random.Random(seed)
+        numbers = list(cert_numbers)
+        rng.shuffle(numbers)
+        # Deletes take numbers from their own pool so each exists when deleted;
+        # edits and lookups use the rest
+        split = len(numbers) // 10 if 'delete' in self.mix else 0
+        self.deletable = numbers[:split]
+        self.cert_numbers = numbers[split:] or numbers
+        self._deletable_lock = threading.Lock()
+        self.cookie = None
+
+    def request(self, method, path, body=None, headers=None):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.timeout)
+        try:
+            headers = dict(headers or {})
+            if self.cookie:
+                headers['Cookie'] = self.cookie
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status, response
+        finally:
+            connection.close()
+
+    def login(self):
+        body = urllib.parse.urlencode({'username': BENCHMARK_ADMIN, 'password': BENCHMARK_PASSWORD})
+        status, response = self.request('POST', '/admin/login', body,
+                                        {'Content-Type': 'application/x-www-form-urlencoded'})
+        cookie = response.getheader('Set-Cookie')
+        if status != 302 or not cookie:
+            raise RuntimeError(f'Benchmark login failed with status {status}')
+        self.cookie = cookie.split(';', 1)[0]
+
+    def certificate_form(self, rng):
+        today = datetime.now().date()
+        return urllib.parse.urlencode({
+            'cert_type[type]': 'BM',
+            'cert_type[title]': 'Benchmark Certificate',
+            'cert_type[description]': 'Created by the load driver',
+            'owner': f'Bench User{rng.randrange(100000)}',
+            'birthdate': '1990-01-01',
+            'address[street]': 'Hauptstraße',
+            'address[no]': str(rng.randint(1, 200)),
+            'address[city]': 'Berlin',
+            'address[zip]': '10115',
+            'contact[phone]': '',
+            'contact[email]': 'bench@example.com',
+            'expire_date': today.replace(year=today.year + 2, day=min(today.day, 28)).isoformat()
+        })
+
+    def run_one(self, route, rng):
+        """Issue one request for route; returns the status, or None when there was nothing to do"""
+        form = {'Content-Type': 'application/x-www-form-urlencoded'}
+        if route == 'verify':
+            return self.request('GET', '/verify/' + rng.choice(self.cert_numbers))[0]
+        if route == 'api_verify':
+            # One lookup in ten is for a number that was never issued
+            number = rng.choice(self.cert_numbers) if rng.random() >= 0.1 else f'CV00-{rng.randrange(10 ** 6)}-000000'
+            return self.request('GET', '/api/verify/' + number, headers={'Accept': 'application/json'})[0]
+        if route == 'dashboard':
+            return self.request('GET', '/admin/dashboard')[0]
+        if route == 'listing':
+            query = urllib.parse.urlencode({'sort': rng.choice(LISTING_SORTS), 'limit': 50})
+            return self.request('GET', '/admin/api/certificates?' + query)[0]
+        if route == 'create':
+            return self.request('POST', '/admin/certificates/new', self.certificate_form(rng), form)[0]
+        if route == 'edit':
+            number = rng.choice(self.cert_numbers)
+            return self.request('PUT', '/admin/certificates/edit/' + number, self.certificate_form(rng), form)[0]
+        if route == 'delete':
+            with self._deletable_lock:
+                if not self.deletable:
+                    return None
+                number = self.deletable.pop()
+            return self.request('DELETE', '/admin/certificates/delete/' + number)[0]
+        raise ValueError(f'Unknown route {route!r}')
+
+    def run(self, duration, warmup=0):
+        """Drive load for duration seconds (after warmup unrecorded seconds); returns route stats"""
+        routes = list(self.mix)
+        weights = [self.mix[route] for route in routes]
+        results = {route: {'latencies': [], 'errors': 0, 'statuses': {}} for route in routes}
+        lock = threading.Lock()
+        start = time.monotonic()
+        record_from = start + warmup
+        deadline = record_from + duration
+
+        def client(index):
+            rng = random.Random(self.seed * 1000 + index)
+            local = {route: ([], [0], {}) for route in routes}
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                route = rng.choices(routes, weights)[0]
+                started = time.perf_counter()
+                try:
+                    status = self.run_one(route, rng)
+                except (OSError, http.client.HTTPException):
+                    status = 'error'
+                elapsed = time.perf_counter() - started
+                if status is None or now < record_from:
+                    continue
+                latencies, errors, statuses = local[route]
+                latencies.append(elapsed)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status not in EXPECTED_STATUS[route]:
+                    errors[0] += 1
+            with lock:
+                for route, (latencies, errors, statuses) in local.items():
+                    results[route]['latencies'].extend(latencies)
+                    results[route]['errors'] += errors[0]
+                    for status, count in statuses.items():
+                        results[route]['statuses'][status] = results[route]['statuses'].get(status, 0) + count
+
+        threads = [threading.Thread(target=client, args=(index,)) for index in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - record_from
+        return summarize(results, elapsed)
+
+def summarize(results, elapsed):
+    """Per-route and overall throughput and latency percentiles (milliseconds)"""
+    def stats(latencies, errors, statuses):
+        ordered = sorted(latencies)
+        milliseconds = lambda value: round(value * 1000, 3) if value is not None else None
+        return {
+            'requests': len(ordered),
+            'errors': errors,
+            'statuses': dict(sorted(statuses.items())),
+            'throughput_rps': round(len(ordered) / elapsed, 2) if elapsed > 0 else 0,
+            'mean_ms': milliseconds(sum(ordered) / len(ordered)) if ordered else None,
+            'p50_ms': milliseconds(percentile(ordered, 0.50)),
+            'p95_ms': milliseconds(percentile(ordered, 0.95)),
+            'p99_ms': milliseconds(percentile(ordered, 0.99)),
+            'max_ms': milliseconds(ordered[-1] if ordered else None)
+        }
+
+    routes = {route: stats(**result) for route, result in sorted(results.items())}
+    all_statuses = {}
+    for result in results.values():
+        for status, count in result['statuses'].items():
+            all_statuses[status] = all_statuses.get(status, 0) + count
+    total = stats([value for result in results.values() for value in result['latencies']],
+                  sum(result['errors'] for result in results.values()), all_statuses)
+    return {'routes': routes, 'total': total}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    """Where a report was produced, so that compared reports can be checked for like-for-like"""
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'started': datetime.now().isoformat(timespec='seconds')
+    }
+
+# Report fields compared between runs, and whether a higher value is better
+COMPARED_FIELDS = {
+    'throughput_rps': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False
+}
+
+def compare_reports(baseline, current, threshold=0.10):
+    """Relative changes per route; returns (rows, regressions).
+
+    A regression is a compared field that got worse by more than threshold
+    (a fraction) on a route present in both reports.
+    """
+    rows = []
+    regressions = []
+    routes = sorted(set(baseline['routes']) | set(current['routes']))
+    for route in routes + ['total']:
+        before = baseline['total'] if route == 'total' else baseline['routes'].get(route)
+        after = current['total'] if route == 'total' else current['routes'].get(route)
+        for field, higher_is_better in COMPARED_FIELDS.items():
+            old = before.get(field) if before else None
+            new = after.get(field) if after else None
+            change = (new - old) / old if old and new is not None else None
+            worse = change is not None and (change < -threshold if higher_is_better else change > threshold)
+            rows.append((route, field, old, new, change, worse))
+            if worse:
+                regressions.append((route, field, change))
+    return rows, regressions
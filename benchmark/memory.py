@@ -0,0 +1,63 @@
+"""Memory held per certificate by the in-memory indexes.
+
+Each structure fed by CertificateIndex is measured with tracemalloc while
+it is built from a synthetic dataset, so the numbers do not depend on the
+allocator or on memory left over from parsing the JSON file.
+"""
+
+import gc
+import json
+import tracemalloc
+
+from benchmark.dataset import generate_certificates
+
+# Bytes per certificate the CertificateIndex records may use (about 610 at
+# 20000 certificates and 540 at 100000 on the generated data with CPython
+# 3.11; the nested dicts they replaced took about 1980)
+RECORD_TARGET_BYTES = 800
+# Fewest certificates the target is checked at: the interned strings and
+# shared dates cost about the same at any count, so smaller runs are
+# dominated by them (over 800 bytes per certificate at 5000)
+RECORD_TARGET_MIN_COUNT = 20000
+
+class _MemoryStore:
+    def __init__(self, text):
+        self.text = text
+
+    def load_certificates(self):
+        return json.loads(self.text)['certificates']
+
+    def version(self):
+        return 1
+
+def measure_memory(count, seed=1, today=None):
+    """Bytes per certificate for the index records, dashboard stats, listing and search"""
+    # Imported here so generating data does not require the server's dependencies
+    from app import CertificateIndex, CertificateListing, CertificateStats
+    from search import SearchIndex
+
+    text = json.dumps({'certificates': list(generate_certificates(count, seed, today))})
+    index = CertificateIndex(_MemoryStore(text))
+    changes = []
+    index.listeners.append(changes.append)
+    consumers = [('stats', CertificateStats()), ('listing', CertificateListing()), ('search', SearchIndex())]
+
+    sizes = {}
+    tracemalloc.start()
+    try:
+        def measure(name, build):
+            gc.collect()
+            before = tracemalloc.get_traced_memory()[0]
+            build()
+            gc.collect()
+            sizes[name] = tracemalloc.get_traced_memory()[0] - before
+
+        measure('records', index.refresh)
+        for name, consumer in consumers:
+            measure(name, lambda: consumer.apply(changes[0]))
+        # The change set handed to the listeners is not part of the index
+        measure('changes', changes.clear)
+        sizes['records'] += sizes.pop('changes')
+    finally:
+        tracemalloc.stop()
+    return {name: round(size / max(count, 1)) for name, size in sizes.items()}
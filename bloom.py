@@ -0,0 +1,115 @@
+"""Bloom filter over issued certificate numbers.
+
+Lets the verify routes turn away numbers that were never issued (the bulk
+of enumeration traffic) before they reach the response cache or storage.
+"""
+
+import hashlib
+import math
+import threading
+
+class BloomFilter:
+    """Fixed-capacity Bloom filter over strings"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(int(capacity), 1024)
+        self.error_rate = error_rate
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class CertificateFilter:
+    """Bloom filter kept in step with the certificate index.
+
+    New cert numbers are added as the index reports them. Deleted ones
+    cannot be taken out of a Bloom filter, so they are counted and the
+    filter is rebuilt from the index once they reach a tenth of its
+    entries, or when it outgrows its capacity. reload() rebuilds it outright,
+    for when the index switched to a new record index without reporting
+    changes.
+    """
+
+    def __init__(self, index, error_rate=0.01):
+        self.index = index
+        self.error_rate = error_rate
+        self.filter = None
+        self.stale = 0
+        self.lookups = 0
+        self.rejected = 0
+        self.false_positives = 0
+        self._lock = threading.Lock()
+
+    def apply(self, changes):
+        added = [cert_number for cert_number, (old, new) in changes.items() if old is None and new is not None]
+        removed = sum(1 for old, new in changes.values() if old is not None and new is None)
+        with self._lock:
+            bloom = self.filter
+            # A change set as large as the filter (the first full load after
+            # reload()) is cheaper to rebuild from than to add twice
+            if (bloom is None or bloom.count + len(added) > bloom.capacity or len(added) >= bloom.count
+                    or self.stale + removed > bloom.count // 10):
+                self._rebuild()
+                return
+            for cert_number in added:
+                bloom.add(cert_number)
+            self.stale += removed
+
+    def reload(self):
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        cert_numbers = self.index.cert_numbers()
+        bloom = BloomFilter(2 * len(cert_numbers), self.error_rate)
+        for cert_number in cert_numbers:
+            bloom.add(cert_number)
+        self.filter = bloom
+        self.stale = 0
+
+    def might_contain(self, cert_number):
+        """False only for cert numbers that are certainly not issued"""
+        bloom = self.filter
+        self.lookups += 1
+        if bloom is None or cert_number in bloom:
+            return True
+        self.rejected += 1
+        return False
+
+    def record_false_positive(self):
+        """Called when a number the filter let through was not found"""
+        if self.filter is not None:
+            self.false_positives += 1
+
+    def stats(self):
+        """Filter size and lookup counters (counted without locking, so approximate)"""
+        bloom = self.filter
+        passed_absent = self.false_positives + self.rejected
+        return {
+            'entries': bloom.count if bloom else 0,
+            'stale_entries': self.stale,
+            'capacity': bloom.capacity if bloom else 0,
+            'size_bytes': len(bloom.bits) if bloom else 0,
+            'hashes': bloom.hashes if bloom else 0,
+            'lookups': self.lookups,
+            'rejected': self.rejected,
+            'false_positives': self.false_positives,
+            'hit_rate': self.rejected / self.lookups if self.lookups else 0.0,
+            'false_positive_rate': self.false_positives / passed_absent if passed_absent else 0.0
+        }
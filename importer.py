@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Bulk certificate import from CSV or NDJSON.
+
+Rows are parsed as a stream, validated, and committed in batches: one
+number reservation and one store write per batch. CSV columns use the
+certificate form field names (owner, cert_type[type], address[city], ...)
+or dotted names (cert_type.type); NDJSON lines use the nested certificate
+format from the README.
+
+Usage:
+    python importer.py certificates.csv --errors import-errors.ndjson
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+from storage import DATABASE_FILE, generate_cert_number, open_store
+
+# Fields the certificate form marks as required
+REQUIRED_FIELDS = [
+    'cert_type[type]', 'cert_type[title]', 'owner', 'birthdate',
+    'address[street]', 'address[no]', 'address[city]', 'address[zip]',
+    'contact[email]', 'expire_date'
+]
+DATE_FIELDS = ['birthdate', 'expire_date']
+
+def flatten_fields(record):
+    """Map a nested or dotted record onto the form field names"""
+    fields = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                fields[f'{key}[{sub_key}]'] = sub_value
+        elif '.' in key:
+            group, _, sub_key = key.partition('.')
+            fields[f'{group}[{sub_key}]'] = value
+        else:
+            fields[key] = value
+    return {key: '' if value is None else str(value).strip() for key, value in fields.items()}
+
+def validate_fields(fields):
+    """Return a list of problems with a flattened row (empty when valid)"""
+    errors = [f'{name} is required' for name in REQUIRED_FIELDS if not fields.get(name)]
+    for name in DATE_FIELDS:
+        if fields.get(name):
+            try:
+                datetime.strptime(fields[name], '%Y-%m-%d')
+            except ValueError:
+                errors.append(f'{name} must be a YYYY-MM-DD date')
+    return errors
+
+def build_certificate(fields, cert_number, year, number):
+    """Create a certificate record from form field values"""
+    # Handle phone number (can be null)
+    phone = fields.get('contact[phone]', '')
+    if not phone or phone.strip() == '':
+        phone = "null"
+
+    return {
+        'cert_number': cert_number,
+        'cert_type': {
+            'type': fields.get('cert_type[type]', ''),
+            'year': year,
+            'number': number,
+            'title': fields.get('cert_type[title]', ''),
+            'description': fields.get('cert_type[description]', '')
+        },
+        'owner': fields.get('owner', ''),
+        'birthdate': fields.get('birthdate', ''),
+        'address': {
+            'street': fields.get('address[street]', ''),
+            'no': fields.get('address[no]', ''),
+            'city': fields.get('address[city]', ''),
+            'zip': fields.get('address[zip]', '')
+        },
+        'contact': {
+            'phone': phone,  # Can be "null"
+            'email': fields.get('contact[email]', '')
+        },
+        'expire_date': fields.get('expire_date', ''),
+        'is_valid': True
+    }
+
+def iter_csv_rows(text):
+    """Yield (row number, record) from a CSV text stream with a header row"""
+    for row_number, row in enumerate(csv.DictReader(text), start=2):
+        yield row_number, {key: value for key, value in row.items() if key}
+
+def iter_ndjson_rows(text):
+    """Yield (line number, record) from an NDJSON text stream"""
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f'Invalid JSON: {e}')
+            continue
+        if not isinstance(record, dict):
+            record = ValueError('Each line must be a JSON object')
+        yield line_number, record
+
+class ChunkReader(io.RawIOBase):
+    """Readable stream over an iterator of byte chunks (e.g. a request body)"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.chunks, None)
+            if self.pending is None:
+                self.pending = b''
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+def open_rows(stream, data_format):
+    """Row iterator for a buffered binary stream in 'csv' or 'ndjson' format"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if data_format == 'csv':
+        return iter_csv_rows(text)
+    return iter_ndjson_rows(text)
+
+class CertificateImporter:
+    """Validate rows and commit them to a store in batches.
+
+    on_error(row_number, errors) is called for each rejected row and
+    on_progress(counts) after every committed batch.
+    """
+
+    def __init__(self, store, generate_cert_number, batch_size=1000, on_error=None, on_progress=None):
+        self.store = store
+        self.generate_cert_number = generate_cert_number
+        self.batch_size = batch_size
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.counts = {'processed': 0, 'imported': 0, 'failed': 0}
+
+    def run(self, rows):
+        pending = []
+        for row_number, record in rows:
+            self.counts['processed'] += 1
+            if isinstance(record, Exception):
+                self.reject(row_number, [str(record)])
+                continue
+            fields = flatten_fields(record)
+            errors = validate_fields(fields)
+            if errors:
+                self.reject(row_number, errors)
+                continue
+            pending.append(fields)
+            if len(pending) >= self.batch_size:
+                self.commit(pending)
+                pending = []
+        if pending:
+            self.commit(pending)
+        return self.counts
+
+    def reject(self, row_number, errors):
+        self.counts['failed'] += 1
+        if self.on_error:
+            self.on_error(row_number, errors)
+
+    def commit(self, batch):
+        issue_date = datetime.now()
+        year = issue_date.year
+        with self.store.transaction():
+            first_number = self.store.allocate_number(year, len(batch))
+            certs = []
+            for offset, fields in enumerate(batch):
+                number = first_number + offset
+                cert_number = self.generate_cert_number(year, number, issue_date)
+                certs.append(build_certificate(fields, cert_number, year, number))
+            self.store.add_certificates(certs)
+        self.counts['imported'] += len(batch)
+        if self.on_progress:
+            self.on_progress(dict(self.counts))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import certificates from CSV or NDJSON')
+    parser.add_argument('file', help="input file, or '-' for stdin")
+    parser.add_argument('--format', choices=['csv', 'ndjson'],
+                        help='input format (default: guessed from the file extension)')
+    parser.add_argument('--storage', choices=['json', 'journal', 'sqlite'], default='json')
+    parser.add_argument('--database', default=DATABASE_FILE)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--errors', help='write the per-row error report (NDJSON) to this file')
+    args = parser.parse_args(argv)
+
+    data_format = args.format or ('csv' if args.file.lower().endswith('.csv') else 'ndjson')
+    error_report = open(args.errors, 'w') if args.errors else sys.stdout
+
+    def report_error(row_number, errors):
+        error_report.write(json.dumps({'row': row_number, 'errors': errors}) + '\n')
+
+    def report_progress(counts):
+        print(f"Imported {counts['imported']} of {counts['processed']} rows "
+              f"({counts['failed']} failed)", file=sys.stderr)
+
+    stream = sys.stdin.buffer if args.file == '-' else open(args.file, 'rb')
+    importer = CertificateImporter(open_store(args.storage, args.database), generate_cert_number,
+                                   args.batch_size, report_error, report_progress)
+    try:
+        counts = importer.run(open_rows(stream, data_format))
+    finally:
+        if error_report is not sys.stdout:
+            error_report.close()
+    print(f"Done: {counts['imported']} imported, {counts['failed']} failed", file=sys.stderr)
+    return 0 if not counts['failed'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
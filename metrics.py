@@ -0,0 +1,214 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+Recording takes no lock: each thread adds to its own shard, a plain dict
+that only that thread writes to, and render() sums the shards when
+/metrics is scraped. Handler threads come from fixed pools, so the number
+of shards stays small. Values read during a scrape may lag a request that
+is being recorded at the same moment, which is fine for monitoring.
+"""
+
+import bisect
+import threading
+import time
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    """A named metric with a fixed list of label names"""
+
+    kind = 'untyped'
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def samples(self, values, names):
+        for labels, value in values:
+            yield f'{self.name}{_format_labels(names, labels)} {_format_value(value)}'
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        shard = self.registry.shard()
+        key = (self, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+class Gauge(Counter):
+    """Up/down value; inc() and dec() for one request must run on the same thread"""
+
+    kind = 'gauge'
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        shard = self.registry.shard()
+        key = (self, labels)
+        counts = shard.get(key)
+        if counts is None:
+            # One slot per bucket, one for +Inf, then the sum of observations
+            counts = shard[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self, values, names):
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f'{self.name}_bucket{_format_labels(names, labels, le)} {cumulative}'
+            label_text = _format_labels(names, labels)
+            yield f'{self.name}_sum{label_text} {_format_value(counts[-1])}'
+            yield f'{self.name}_count{label_text} {cumulative}'
+
+class CallbackMetric(Metric):
+    """Metric read at scrape time from callback().
+
+    The callback returns a number, or {label values: number} for a metric
+    with labels.
+    """
+
+    def __init__(self, registry, name, help, kind, callback, labels=()):
+        super().__init__(registry, name, help, labels)
+        self.kind = kind
+        self.callback = callback
+
+    def read(self):
+        try:
+            values = self.callback()
+        except Exception as e:
+            print(f"Error reading metric {self.name}: {str(e)}")
+            return []
+        if isinstance(values, dict):
+            return sorted(values.items())
+        return [((), values)]
+
+class Registry:
+    """The metrics of one process and the per-thread shards holding their values.
+
+    process_labels, a tuple of (name, value) pairs, is added to every sample;
+    processes sharing a port set it to tell their series apart.
+    """
+
+    def __init__(self):
+        self.process_labels = ()
+        self.metrics = []
+        self._shards = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(self, name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._register(Gauge(self, name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, help, labels, buckets))
+
+    def callback(self, name, help, kind, callback, labels=()):
+        return self._register(CallbackMetric(self, name, help, kind, callback, labels))
+
+    def shard(self):
+        """The calling thread's {(metric, label values): value} dict"""
+        values = getattr(self._local, 'values', None)
+        if values is None:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append(values)
+        return values
+
+    def collect(self):
+        """Sum the shards into {metric: {label values: value}}"""
+        with self._lock:
+            shards = list(self._shards)
+        totals = {}
+        for shard in shards:
+            # dict.copy() is atomic, so a recording thread cannot resize it mid-read
+            for (metric, labels), value in shard.copy().items():
+                values = totals.setdefault(metric, {})
+                if isinstance(value, list):
+                    current = values.get(labels)
+                    values[labels] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    values[labels] = values.get(labels, 0) + value
+        return totals
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format, as bytes"""
+        totals = self.collect()
+        process_names = tuple(name for name, _ in self.process_labels)
+        process_values = tuple(value for _, value in self.process_labels)
+        lines = []
+        for metric in self.metrics:
+            if isinstance(metric, CallbackMetric):
+                values = metric.read()
+            else:
+                values = sorted(totals.get(metric, {}).items(), key=lambda item: item[0])
+            values = [(tuple(labels) + process_values, value) for labels, value in values]
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples(values, metric.labels + process_names))
+        return ('\n'.join(lines) + '\n').encode()
+
+class TimedStore:
+    """Storage backend wrapper that reports how long reads and writes take.
+
+    Calls to methods named load_*, get_*, add_*, update_*, delete_* and
+    allocate_* are passed to observe(method name, seconds); everything else
+    (version(), transaction(), attributes) goes straight through.
+    """
+
+    timed_prefixes = ('load_', 'get_', 'add_', 'update_', 'delete_', 'allocate_')
+
+    def __init__(self, store, observe):
+        self.store = store
+        self.observe = observe
+
+    def __getattr__(self, name):
+        attribute = getattr(self.store, name)
+        if not name.startswith(self.timed_prefixes) or not callable(attribute):
+            return attribute
+        observe = self.observe
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - started)
+        return timed
@@ -0,0 +1,98 @@
+"""scrypt password hashing and checking in a bounded pool of worker processes.
+
+scrypt is deliberately slow; running it in request threads lets a burst of
+logins starve everything else. PasswordPool caps the CPU spent on it at
+``processes`` cores and refuses work beyond ``max_pending`` queued jobs
+instead of letting requests pile up behind it.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+def _exit_with_parent(parent_pid, interval=1.0):
+    """Worker initializer: exit once the server process is gone.
+
+    Pool workers hold both ends of their queue pipes, so they would never
+    notice a server that was killed without shutting the pool down.
+    """
+    def watch():
+        while True:
+            time.sleep(interval)
+            try:
+                os.kill(parent_pid, 0)
+            except ProcessLookupError:
+                os._exit(0)
+            except PermissionError:
+                pass
+
+    threading.Thread(target=watch, daemon=True).start()
+
+class PasswordPoolBusy(Exception):
+    """Raised when the pool already has max_pending jobs waiting"""
+
+class PasswordPool:
+    """Run password hashing in worker processes (processes=0 runs it inline)"""
+
+    def __init__(self, processes=2, max_pending=8, timeout=30):
+        self.processes = processes
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        # Created lazily, once per process: prefork workers get their own pool
+        with self._lock:
+            if self._pid != os.getpid() or self._executor is None:
+                # forkserver workers do not inherit the listening socket or
+                # the server's threads
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=context,
+                                                     initializer=_exit_with_parent, initargs=(os.getpid(),))
+                self._slots = threading.BoundedSemaphore(self.processes + self.max_pending)
+                self._pid = os.getpid()
+            return self._executor, self._slots
+
+    def _run(self, function, *args):
+        if not self.processes:
+            return function(*args)
+        executor, slots = self._start()
+        if not slots.acquire(blocking=False):
+            raise PasswordPoolBusy('Too many password checks in progress')
+        try:
+            future = executor.submit(function, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(self.timeout)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next caller
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+
+    def shutdown(self):
+        """Stop this process's workers, letting running jobs finish; a later call starts a new pool"""
+        with self._lock:
+            executor = self._executor if self._pid == os.getpid() else None
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def check(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, 'scrypt')
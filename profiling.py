@@ -0,0 +1,221 @@
+"""Per-request phase timings, the slow-request log and the sampling profiler.
+
+RequestPhases keeps a timing record for the request the current thread is
+handling; storage, rendering and response writes add their time to it so
+that a slow request can be logged with where its time went. The profiler
+runs cProfile on a configurable share of requests and aggregates the
+results per route until an administrator downloads or resets them.
+"""
+
+import collections
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+PHASES = ('parse', 'store', 'render', 'write')
+# Orders report() accepts: pstats.SortKey values, and tottime as an alias of time
+SORT_KEYS = tuple(key.value for key in pstats.SortKey) + ('tottime',)
+REPORT_FORMATS = ('text', 'pstats')
+
+# Client supplied X-Request-ID values are reused only when they look like ids
+REQUEST_ID = re.compile(r'[A-Za-z0-9._-]{1,64}')
+
+def request_id(supplied=None):
+    if supplied and REQUEST_ID.fullmatch(supplied):
+        return supplied
+    return secrets.token_hex(8)
+
+class RequestTiming:
+    """Phase totals (seconds) of one request"""
+
+    __slots__ = ('request_id', 'started', 'phases', 'active')
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.active = None
+
+class RequestPhases:
+    """Timing record of the request each thread is handling.
+
+    Phases do not nest: time spent in a phase while another one is open
+    (a template render reading the store, say) counts towards the outer one.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def start(self, request_id):
+        timing = self._local.timing = RequestTiming(request_id)
+        return timing
+
+    def current(self):
+        return getattr(self._local, 'timing', None)
+
+    def finish(self):
+        timing = self.current()
+        self._local.timing = None
+        return timing
+
+    def add(self, name, seconds):
+        timing = self.current()
+        if timing is not None and timing.active is None:
+            timing.phases[name] += seconds
+
+    @contextmanager
+    def phase(self, name):
+        timing = self.current()
+        if timing is None or timing.active is not None:
+            yield
+            return
+        timing.active = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            timing.active = None
+            timing.phases[name] += time.perf_counter() - started
+
+class TimedWriter:
+    """Response stream wrapper that adds write() time to the 'write' phase"""
+
+    def __init__(self, stream, phases):
+        self.stream = stream
+        self.phases = phases
+
+    def write(self, data):
+        with self.phases.phase('write'):
+            return self.stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class SlowRequestLog:
+    """Logs requests slower than threshold seconds and keeps the latest ones"""
+
+    def __init__(self, threshold=0.5, size=200):
+        self.threshold = threshold
+        self.entries = collections.deque(maxlen=size)
+
+    def record(self, timing, method, route, status, duration):
+        if not self.threshold or duration < self.threshold:
+            return
+        phases = {name: round(seconds * 1000, 3) for name, seconds in timing.phases.items()}
+        phases['other'] = round(max(0.0, duration * 1000 - sum(phases.values())), 3)
+        entry = {
+            'request_id': timing.request_id,
+            'time': time.time(),
+            'method': method,
+            'route': route,
+            'status': status,
+            'duration_ms': round(duration * 1000, 3),
+            'phases_ms': phases
+        }
+        self.entries.append(entry)
+        breakdown = ', '.join(f'{name} {value:.1f}' for name, value in phases.items())
+        print(f"Slow request {timing.request_id}: {method} {route} {status} "
+              f"{entry['duration_ms']:.1f}ms ({breakdown})")
+
+    def recent(self):
+        return list(self.entries)
+
+class SamplingProfiler:
+    """Profiles a share of requests with cProfile, aggregated per route.
+
+    Only one request is profiled at a time, so each profile holds exactly
+    one request's calls; a request arriving while another is being
+    profiled is simply not sampled. The profiler hooks only the thread
+    handling the request, so time spent in other threads on its behalf
+    (e.g. the password pool or the import worker) is not recorded.
+    """
+
+    def __init__(self):
+        self.fraction = 0.0
+        self.until = 0.0
+        self.samples = collections.Counter()
+        self._stats = {}
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+
+    def start(self, fraction, duration, reset=False):
+        with self._lock:
+            if reset:
+                self._stats = {}
+                self.samples = collections.Counter()
+            self.fraction = min(max(float(fraction), 0.0), 1.0)
+            self.until = time.time() + duration if self.fraction else 0.0
+
+    def stop(self):
+        self.start(0, 0)
+
+    def active(self):
+        return self.fraction > 0 and time.time() < self.until
+
+    def begin(self):
+        """Start a profile for this request when it is sampled, else return None"""
+        if not self.active() or random.random() >= self.fraction:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (a debugger, say) already owns the hook
+            self._busy.release()
+            return None
+        return profile
+
+    def end(self, profile, route):
+        profile.disable()
+        self._busy.release()
+        with self._lock:
+            stats = self._stats.get(route)
+            if stats is None:
+                self._stats[route] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+            self.samples[route] += 1
+
+    def status(self):
+        return {
+            'active': self.active(),
+            'fraction': self.fraction,
+            'until': self.until if self.active() else None,
+            'samples': dict(self.samples)
+        }
+
+    def _combined(self, route=None):
+        with self._lock:
+            if route is not None:
+                selected = [self._stats[route]] if route in self._stats else []
+            else:
+                selected = list(self._stats.values())
+            if not selected:
+                return None
+            combined = pstats.Stats()
+            combined.add(*selected)
+            return combined
+
+    def export(self, route=None):
+        """Aggregated profile in the pstats file format, or None"""
+        stats = self._combined(route)
+        return marshal.dumps(stats.stats) if stats else None
+
+    def report(self, route=None, sort='cumulative', limit=40):
+        """Plain-text summary of the aggregated profile, or None"""
+        stats = self._combined(route)
+        if stats is None:
+            return None
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
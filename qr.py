@@ -0,0 +1,539 @@
+"""QR codes for certificate verification links, rendered as PNG or SVG.
+
+The encoder covers what verification links need: byte mode, versions 1 to
+40 and the four error correction levels, with the mask chosen by the
+standard penalty rules. It needs nothing outside the standard library.
+
+Rendered images are cached at two levels by QRImages: a bounded LRU in
+memory and a directory on disk whose file names are the SHA-256 of
+everything that went into the image, so entries never go stale and
+several processes can fill the same directory. prerender() renders the
+images for a list of certificates in worker processes ahead of a print
+run.
+
+    python qr.py prerender --base-url https://certs.example.com
+    python qr.py render CV24-001-241121 --base-url https://certs.example.com --output jdoe.svg
+"""
+
+import argparse
+import functools
+import hashlib
+import os
+import re
+import struct
+import sys
+import threading
+import urllib.parse
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+CACHE_DIR = 'data/qr'
+# Part of every cache key; bump it when the rendered output changes
+RENDERER_VERSION = 1
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Per error correction level (L, M, Q, H), indexed by version; index 0 is unused
+ECC_CODEWORDS_PER_BLOCK = {
+    'L': (-1, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28, 28, 28, 30, 30, 26,
+          28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    'M': (-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26, 26, 28, 28, 28, 28,
+          28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),
+    'Q': (-1, 13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30, 28, 30, 30, 30, 30,
+          28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    'H': (-1, 17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28, 30, 24, 30, 30, 30,
+          30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30)
+}
+ERROR_CORRECTION_BLOCKS = {
+    'L': (-1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8, 8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16,
+          17, 18, 19, 19, 20, 21, 22, 24, 25),
+    'M': (-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16, 17, 17, 18, 20, 21, 23, 25, 26, 28,
+          29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),
+    'Q': (-1, 1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20, 23, 23, 25, 27, 29, 34, 34, 35,
+          38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),
+    'H': (-1, 1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25, 25, 34, 30, 32, 35, 37, 40, 42,
+          45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81)
+}
+FORMAT_BITS = {'L': 1, 'M': 0, 'Q': 3, 'H': 2}
+
+MASKS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0
+)
+
+RUN = re.compile('1+|0+')
+
+# Powers of 2 and their logarithms in GF(2^8) modulo x^8 + x^4 + x^3 + x^2 + 1
+_EXP = []
+_LOG = [0] * 256
+_value = 1
+for _power in range(255):
+    _EXP.append(_value)
+    _LOG[_value] = _power
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11D
+_EXP += _EXP
+
+def _gf_multiply(x, y):
+    return _EXP[_LOG[x] + _LOG[y]] if x and y else 0
+
+@functools.lru_cache(maxsize=None)
+def _rs_divisor(degree):
+    divisor = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            divisor[j] = _gf_multiply(divisor[j], root)
+            if j + 1 < degree:
+                divisor[j] ^= divisor[j + 1]
+        root = _gf_multiply(root, 0x02)
+    return tuple(divisor)
+
+def _rs_remainder(data, divisor):
+    remainder = [0] * len(divisor)
+    for byte in data:
+        factor = byte ^ remainder.pop(0)
+        remainder.append(0)
+        for i, coefficient in enumerate(divisor):
+            remainder[i] ^= _gf_multiply(coefficient, factor)
+    return remainder
+
+def _raw_data_modules(version):
+    """Modules left for data and error correction after the function patterns"""
+    result = (16 * version + 128) * version + 64
+    if version >= 2:
+        alignments = version // 7 + 2
+        result -= (25 * alignments - 10) * alignments - 55
+        if version >= 7:
+            result -= 36
+    return result
+
+def _data_codewords(version, level):
+    return (_raw_data_modules(version) // 8
+            - ECC_CODEWORDS_PER_BLOCK[level][version] * ERROR_CORRECTION_BLOCKS[level][version])
+
+def _alignment_positions(version):
+    if version == 1:
+        return []
+    alignments = version // 7 + 2
+    step = (version * 8 + alignments * 3 + 5) // (alignments * 4 - 4) * 2
+    size = version * 4 + 17
+    return [6] + [size - 7 - i * step for i in reversed(range(alignments - 1))]
+
+def _format_modules(size, level, mask):
+    """((x, y), dark) for both copies of the format information and the dark module"""
+    data = FORMAT_BITS[level] << 3 | mask
+    remainder = data
+    for _ in range(10):
+        remainder = (remainder << 1) ^ ((remainder >> 9) * 0x537)
+    bits = (data << 10 | remainder) ^ 0x5412
+    bit = [(bits >> i) & 1 == 1 for i in range(15)]
+    first = [(8, i) for i in range(6)] + [(8, 7), (8, 8), (7, 8)] + [(14 - i, 8) for i in range(9, 15)]
+    second = [(size - 1 - i, 8) for i in range(8)] + [(8, size - 15 + i) for i in range(8, 15)]
+    return list(zip(first, bit)) + list(zip(second, bit)) + [((8, size - 8), True)]
+
+def _row_bits(size, modules):
+    """Rows as integers, leftmost module in the highest bit"""
+    rows = [0] * size
+    for (x, y), dark in modules:
+        if dark:
+            rows[y] |= 1 << (size - 1 - x)
+    return rows
+
+# Per version and mask: the mask pattern as row integers, without function modules
+_mask_patterns = {}
+
+class QRCode:
+    """A QR code symbol; modules[y][x] is True for dark modules"""
+
+    def __init__(self, data, level='M', mask=None):
+        if level not in FORMAT_BITS:
+            raise ValueError(f'Unknown error correction level: {level}')
+        if isinstance(data, str):
+            data = data.encode()
+        self.level = level
+        for version in range(1, 41):
+            count_bits = 8 if version <= 9 else 16
+            if len(data) < 1 << count_bits and 4 + count_bits + 8 * len(data) <= _data_codewords(version, level) * 8:
+                break
+        else:
+            raise ValueError(f'{len(data)} bytes do not fit in a QR code at level {level}')
+        self.version = version
+        self.size = version * 4 + 17
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self._function = [[False] * self.size for _ in range(self.size)]
+        self._draw_function_patterns()
+        self._draw_codewords(self._add_error_correction(self._encode_data(data, count_bits)))
+
+        # Masks are tried on row integers; format bits are reserved but not drawn yet
+        size = self.size
+        rows = [int(''.join('1' if dark else '0' for dark in row), 2) for row in self.modules]
+        best = None
+        for candidate in range(8) if mask is None else [mask]:
+            patterns = self._mask_pattern(candidate)
+            masked = [row ^ pattern | fixed for row, pattern, fixed in
+                      zip(rows, patterns, _row_bits(size, _format_modules(size, level, candidate)))]
+            penalty = self._penalty(masked) if mask is None else 0
+            if best is None or penalty < best[0]:
+                best = (penalty, candidate, masked)
+        _, self.mask, masked = best
+        self.modules = [[bit == '1' for bit in format(row, f'0{size}b')] for row in masked]
+        del self._function
+
+    def _encode_data(self, data, count_bits):
+        capacity = _data_codewords(self.version, self.level) * 8
+        bits = (0b0100 << count_bits | len(data)) << 8 * len(data) | int.from_bytes(data, 'big')
+        length = 4 + count_bits + 8 * len(data)
+        # Terminator, then zeros up to a byte boundary
+        padding = min(4, capacity - length)
+        padding += -(length + padding) % 8
+        bits <<= padding
+        length += padding
+        codewords = list(bits.to_bytes(length // 8, 'big'))
+        pad = 0xEC
+        while len(codewords) < capacity // 8:
+            codewords.append(pad)
+            pad ^= 0xEC ^ 0x11
+        return codewords
+
+    def _add_error_correction(self, data):
+        blocks_count = ERROR_CORRECTION_BLOCKS[self.level][self.version]
+        ecc_length = ECC_CODEWORDS_PER_BLOCK[self.level][self.version]
+        raw_codewords = _raw_data_modules(self.version) // 8
+        short_blocks = blocks_count - raw_codewords % blocks_count
+        short_length = raw_codewords // blocks_count
+        divisor = _rs_divisor(ecc_length)
+
+        blocks = []
+        position = 0
+        for i in range(blocks_count):
+            length = short_length - ecc_length + (0 if i < short_blocks else 1)
+            block = data[position:position + length]
+            position += length
+            ecc = _rs_remainder(block, divisor)
+            if i < short_blocks:
+                block.append(0)  # Placeholder, skipped when interleaving
+            blocks.append(block + ecc)
+
+        result = []
+        for i in range(len(blocks[0])):
+            for j, block in enumerate(blocks):
+                if i != short_length - ecc_length or j >= short_blocks:
+                    result.append(block[i])
+        return result
+
+    def _set_function(self, x, y, dark):
+        self.modules[y][x] = dark
+        self._function[y][x] = True
+
+    def _draw_function_patterns(self):
+        size = self.size
+        for i in range(size):
+            self._set_function(6, i, i % 2 == 0)
+            self._set_function(i, 6, i % 2 == 0)
+        for x, y in ((3, 3), (size - 4, 3), (3, size - 4)):
+            self._draw_finder(x, y)
+        positions = _alignment_positions(self.version)
+        last = len(positions) - 1
+        for i, x in enumerate(positions):
+            for j, y in enumerate(positions):
+                # Skip the three that would overlap the finder patterns
+                if (i, j) not in ((0, 0), (0, last), (last, 0)):
+                    for dy in range(-2, 3):
+                        for dx in range(-2, 3):
+                            self._set_function(x + dx, y + dy, max(abs(dx), abs(dy)) != 1)
+        for (x, y), _ in _format_modules(size, self.level, 0):
+            self._set_function(x, y, False)  # Reserved; drawn once the mask is known
+        self._draw_version()
+
+    def _draw_finder(self, x, y):
+        for dy in range(-4, 5):
+            for dx in range(-4, 5):
+                if 0 <= x + dx < self.size and 0 <= y + dy < self.size:
+                    self._set_function(x + dx, y + dy, max(abs(dx), abs(dy)) not in (2, 4))
+
+    def _draw_version(self):
+        if self.version < 7:
+            return
+        remainder = self.version
+        for _ in range(12):
+            remainder = (remainder << 1) ^ ((remainder >> 11) * 0x1F25)
+        bits = self.version << 12 | remainder
+        for i in range(18):
+            dark = (bits >> i) & 1 == 1
+            a, b = self.size - 11 + i % 3, i // 3
+            self._set_function(a, b, dark)
+            self._set_function(b, a, dark)
+
+    def _draw_codewords(self, codewords):
+        size = self.size
+        total = len(codewords) * 8
+        i = 0
+        right = size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5  # Skip the vertical timing pattern
+            upward = (right + 1) & 2 == 0
+            for vertical in range(size):
+                y = size - 1 - vertical if upward else vertical
+                for x in (right, right - 1):
+                    if not self._function[y][x] and i < total:
+                        self.modules[y][x] = (codewords[i >> 3] >> (7 - (i & 7))) & 1 == 1
+                        i += 1
+            right -= 2
+
+    def _mask_pattern(self, mask):
+        key = (self.version, mask)
+        if key not in _mask_patterns:
+            masked = MASKS[mask]
+            _mask_patterns[key] = _row_bits(self.size, (
+                ((x, y), not function[x] and masked(x, y))
+                for y, function in enumerate(self._function) for x in range(self.size)))
+        return _mask_patterns[key]
+
+    def _penalty(self, rows):
+        """Penalty score of a masked symbol given as row integers"""
+        size = self.size
+        lines = [format(row, f'0{size}b') for row in rows]
+        result = sum(self._line_penalty(line) for line in lines)
+        result += sum(self._line_penalty(''.join(column)) for column in zip(*lines))
+        # 2x2 blocks of one color
+        pairs = (1 << (size - 1)) - 1
+        for row, below in zip(rows, rows[1:]):
+            same = ~(row ^ below)
+            result += 3 * bin(same & (same >> 1) & ~(row ^ (row >> 1)) & pairs).count('1')
+        # Balance of dark and light modules
+        dark = sum(bin(row).count('1') for row in rows)
+        total = size * size
+        result += ((abs(dark * 20 - total * 10) + total - 1) // total - 1) * 10
+        return result
+
+    def _line_penalty(self, line):
+        """Runs of five or more, and finder-like 1:1:3:1:1 patterns, in one row or column"""
+        runs = [len(run) for run in RUN.findall(line)]
+        result = sum(run - 2 for run in runs if run >= 5)
+        # Alternate light and dark runs, starting and ending with light ones
+        # that include the quiet zone around the symbol
+        if line[0] == '1':
+            runs.insert(0, 0)
+        if line[-1] == '1':
+            runs.append(0)
+        runs[0] += self.size
+        runs[-1] += self.size
+        for i in range(1, len(runs) - 5, 2):
+            n = runs[i]
+            if runs[i + 1] == runs[i + 3] == runs[i + 4] == n and runs[i + 2] == n * 3:
+                before, after = runs[i - 1], runs[i + 5]
+                result += 40 * ((before >= n * 4 and after >= n) + (after >= n * 4 and before >= n))
+        return result
+
+def render_png(code, scale=8, border=4):
+    """1-bit greyscale PNG with scale pixels per module and a quiet zone of border modules"""
+    width = (code.size + 2 * border) * scale
+    light_row = b'\0' + bytes(b'\xff' * ((width + 7) // 8))
+    rows = []
+    for y in range(-border, code.size + border):
+        if not 0 <= y < code.size:
+            rows.append(light_row * scale)
+            continue
+        bits = '1' * border * scale
+        bits += ''.join(('0' if dark else '1') * scale for dark in code.modules[y])
+        bits += '1' * (border * scale + -width % 8)
+        rows.append((b'\0' + int(bits, 2).to_bytes(len(bits) // 8, 'big')) * scale)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, width, 1, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(b''.join(rows)))
+            + chunk(b'IEND', b''))
+
+def render_svg(code, scale=8, border=4):
+    """SVG with one path for the dark modules, drawn as horizontal runs"""
+    width = code.size + 2 * border
+    runs = []
+    for y, row in enumerate(code.modules):
+        x = 0
+        while x < code.size:
+            if row[x]:
+                start = x
+                while x < code.size and row[x]:
+                    x += 1
+                runs.append(f'M{start + border},{y + border}h{x - start}v1h-{x - start}z')
+            x += 1
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width * scale}" height="{width * scale}" '
+            f'viewBox="0 0 {width} {width}" shape-rendering="crispEdges">'
+            f'<rect width="{width}" height="{width}" fill="#fff"/>'
+            f'<path d="{"".join(runs)}" fill="#000"/></svg>\n').encode()
+
+RENDERERS = {'png': render_png, 'svg': render_svg}
+
+def verify_url(base_url, cert_number):
+    """The verification link a certificate's QR code points to"""
+    return f"{base_url.rstrip('/')}/verify/{urllib.parse.quote(str(cert_number), safe='')}"
+
+class QRImages:
+    """Rendered QR images, from a bounded LRU, then the disk cache, then the encoder"""
+
+    def __init__(self, directory=CACHE_DIR, max_entries=1024, level='M', scale=8, border=4):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.level = level
+        self.scale = scale
+        self.border = border
+        self.hits = 0
+        self.misses = 0
+        self.rendered = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, text, image_format):
+        """SHA-256 of everything the image depends on; names the file and serves as ETag"""
+        parts = [RENDERER_VERSION, image_format, self.level, self.scale, self.border, text]
+        return hashlib.sha256('\0'.join(map(str, parts)).encode()).hexdigest()
+
+    def path(self, key, image_format):
+        return os.path.join(self.directory, key[:2], f'{key}.{image_format}')
+
+    def get(self, text, image_format):
+        """Return (image bytes, key) for text rendered as png or svg"""
+        if image_format not in RENDERERS:
+            raise ValueError(f'Unknown image format: {image_format}')
+        key = self.key(text, image_format)
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return body, key
+            self.misses += 1
+
+        body = self._load(key, image_format)
+        if body is None:
+            body = RENDERERS[image_format](QRCode(text, self.level), self.scale, self.border)
+            self.rendered += 1
+            self._save(key, image_format, body)
+        if self.max_entries:
+            with self._lock:
+                self._entries[key] = body
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return body, key
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self, key, image_format):
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(key, image_format), 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def _save(self, key, image_format, body):
+        if self.directory is None:
+            return
+        path = self.path(key, image_format)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temporary, 'wb') as file:
+                file.write(body)
+            os.replace(temporary, path)
+        except OSError as e:
+            print(f"Error writing QR cache file {path}: {e}")
+
+def _prerender_chunk(options, texts, formats):
+    images = QRImages(max_entries=0, **options)
+    rendered = 0
+    for text in texts:
+        code = None
+        for image_format in formats:
+            key = images.key(text, image_format)
+            if os.path.exists(images.path(key, image_format)):
+                continue
+            # One encoding serves every format
+            code = code or QRCode(text, images.level)
+            images._save(key, image_format, RENDERERS[image_format](code, images.scale, images.border))
+            rendered += 1
+    return len(texts), rendered
+
+def prerender(texts, images, formats=('png',), workers=None, chunk_size=256, report_progress=None):
+    """Render every text into the disk cache of images using worker processes.
+
+    Images already on disk are left alone. Returns {'certificates', 'rendered'}.
+    """
+    options = {'directory': images.directory, 'level': images.level, 'scale': images.scale,
+               'border': images.border}
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    counts = {'certificates': 0, 'rendered': 0}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_prerender_chunk, options, chunk, formats) for chunk in chunks]
+        for future in futures:
+            done, rendered = future.result()
+            counts['certificates'] += done
+            counts['rendered'] += rendered
+            if report_progress:
+                report_progress(counts)
+    return counts
+
+def main(argv=None):
+    from storage import DATABASE_FILE, open_store
+
+    env = os.environ
+    parser = argparse.ArgumentParser(description='Render verification QR codes')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name in ('prerender', 'render'):
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument('--base-url', default=env.get('CERTVERIF_PUBLIC_URL', 'http://localhost:5000'),
+                               help='scheme and host the codes link to (env: CERTVERIF_PUBLIC_URL)')
+        subparser.add_argument('--level', choices=list(FORMAT_BITS), default='M', help='error correction level')
+        subparser.add_argument('--scale', type=int, default=8, help='pixels per module (default 8)')
+        subparser.add_argument('--border', type=int, default=4, help='quiet zone in modules (default 4)')
+        if name == 'prerender':
+            subparser.add_argument('--format', action='append', choices=list(RENDERERS),
+                                   help='image format, repeatable (default png)')
+            subparser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+            subparser.add_argument('--cache-dir', default=CACHE_DIR)
+            subparser.add_argument('--storage', choices=['json', 'journal', 'sqlite'], default='json')
+            subparser.add_argument('--database', default=DATABASE_FILE)
+        else:
+            subparser.add_argument('cert_number')
+            subparser.add_argument('--output', required=True, help='file to write; .png or .svg')
+    args = parser.parse_args(argv)
+
+    if args.command == 'render':
+        image_format = os.path.splitext(args.output)[1].lstrip('.').lower()
+        if image_format not in RENDERERS:
+            parser.error('--output must end in .png or .svg')
+        code = QRCode(verify_url(args.base_url, args.cert_number), args.level)
+        with open(args.output, 'wb') as file:
+            file.write(RENDERERS[image_format](code, args.scale, args.border))
+        return 0
+
+    store = open_store(args.storage, args.database)
+    texts = [verify_url(args.base_url, cert['cert_number']) for cert in store.load_certificates()]
+    images = QRImages(args.cache_dir, 0, args.level, args.scale, args.border)
+
+    def report_progress(counts):
+        print(f"{counts['certificates']} of {len(texts)} certificates, {counts['rendered']} images rendered",
+              file=sys.stderr)
+
+    counts = prerender(texts, images, args.format or ['png'], args.workers, report_progress=report_progress)
+    print(f"Done: {counts['rendered']} images rendered for {counts['certificates']} certificates "
+          f"in {images.directory}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
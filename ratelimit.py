@@ -0,0 +1,91 @@
+"""Token-bucket rate limiting keyed by client (IP address, username, API key)."""
+
+import threading
+import time
+from collections import OrderedDict
+
+class RateLimiter:
+    """Token buckets per key, refilled at rate tokens per second up to burst.
+
+    Buckets live in an LRU table capped at max_keys, so memory stays bounded
+    however many clients show up; an evicted key starts over with a full
+    bucket.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _level(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst
+        level, updated = bucket
+        return min(self.burst, level + (now - updated) * self.rate)
+
+    def acquire(self, *keys):
+        """Take one token from each key's bucket.
+
+        Returns 0 when every bucket had a token, otherwise the seconds until
+        they all will; nothing is taken in that case.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = [self._level(key, now) for key in keys]
+            wait = max((1 - level) / self.rate for level in levels)
+            if wait > 0:
+                return wait
+            for key, level in zip(keys, levels):
+                self._buckets[key] = (level - 1, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0
+
+def parse_limit(spec):
+    """Parse 'route=rate[/burst]' (requests per second) into (route, (rate, burst))"""
+    route, sep, value = spec.partition('=')
+    if not sep or not route.strip():
+        raise ValueError(f"Expected ROUTE=RATE[/BURST], got {spec!r}")
+    rate, _, burst = value.partition('/')
+    rate = float(rate)
+    burst = float(burst) if burst else max(1.0, rate)
+    if not rate >= 0:
+        raise ValueError(f"Rate must be a positive number, or 0 for no limit, got {spec!r}")
+    # A bucket smaller than one token never lets a request through
+    if rate and not burst >= 1:
+        raise ValueError(f"Burst must be at least 1, got {spec!r}")
+    return route.strip(), (rate, burst)
+
+class RouteLimiter:
+    """Per-route token buckets for anonymous clients (by IP) and API-key holders.
+
+    limits maps a route name to (rate, burst); a rate of 0 turns limiting off
+    for that route. Requests carrying one of the configured API keys are
+    limited per key, at api_key_factor times the anonymous limits; any other
+    key is ignored so that made-up keys cannot dodge the per-IP limit.
+    """
+
+    def __init__(self, limits, api_keys=(), api_key_factor=10, max_clients=100000):
+        self.api_keys = frozenset(api_keys)
+        self.limiters = {}
+        self.configure(limits, api_key_factor, max_clients)
+
+    def configure(self, limits, api_key_factor=10, max_clients=100000):
+        self.limiters = {
+            route: (RateLimiter(rate, burst, max_clients),
+                    RateLimiter(rate * api_key_factor, burst * api_key_factor, max_clients))
+            for route, (rate, burst) in limits.items() if rate > 0
+        }
+
+    def acquire(self, route, client_ip, api_key=None):
+        """Return 0 when the request may proceed, else the seconds to wait"""
+        limiters = self.limiters.get(route)
+        if limiters is None:
+            return 0
+        if api_key and api_key in self.api_keys:
+            return limiters[1].acquire(api_key)
+        return limiters[0].acquire(client_ip)
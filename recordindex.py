@@ -0,0 +1,121 @@
+"""Sorted on-disk index of certificates for lookups without loading the JSON file.
+
+Two files are written next to certificates.json:
+
+* certificates.records - every certificate as one line of compact JSON,
+  in cert_number order, after a 16-byte build id;
+* certificates.idx - a header followed by fixed-width entries
+  (cert_number padded with NUL bytes, record offset, record length),
+  sorted by cert_number.
+
+Readers mmap both files and binary-search the entries, so a lookup parses
+one record instead of the whole dataset, and processes reading the same
+files share their pages through the OS cache. The header records the
+certificates.json signature (mtime, size, inode) the index was built
+from; an index that does not match the current file is ignored.
+"""
+
+import json
+import mmap
+import os
+import secrets
+import struct
+
+MAGIC = b'CVIDX1\0\0'
+# magic, key width, entry count, source signature (mtime_ns, size, inode), build id
+HEADER = struct.Struct('<8sII3q16s')
+
+def _entry_struct(key_width):
+    return struct.Struct(f'<{key_width}sQI')
+
+def write_record_index(certificates, index_path, records_path, signature):
+    """Write the index and record files for a list of certificates.
+
+    The first certificate with a given cert_number wins, as in the
+    in-memory index. Both files are replaced atomically, records first.
+    """
+    records = {}
+    for cert in certificates:
+        records.setdefault(str(cert['cert_number']).encode(), cert)
+    keys = sorted(records)
+    key_width = max((len(key) for key in keys), default=1)
+    entry = _entry_struct(key_width)
+    build_id = secrets.token_bytes(16)
+
+    entries = []
+    with open(records_path + '.tmp', 'wb') as file:
+        file.write(build_id)
+        offset = len(build_id)
+        for key in keys:
+            line = json.dumps(records[key], separators=(',', ':')).encode() + b'\n'
+            file.write(line)
+            entries.append(entry.pack(key, offset, len(line)))
+            offset += len(line)
+    with open(index_path + '.tmp', 'wb') as file:
+        file.write(HEADER.pack(MAGIC, key_width, len(keys), *signature, build_id))
+        file.write(b''.join(entries))
+    os.replace(records_path + '.tmp', records_path)
+    os.replace(index_path + '.tmp', index_path)
+
+class RecordIndex:
+    """Read-only view of an index/record file pair"""
+
+    def __init__(self, index_path, records_path):
+        with open(index_path, 'rb') as file:
+            self._index = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(records_path, 'rb') as file:
+            self._records = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.key_width, self.count, *signature, build_id = HEADER.unpack_from(self._index)
+        self.signature = tuple(signature)
+        self._entry = _entry_struct(self.key_width)
+        if magic != MAGIC:
+            raise ValueError(f'{index_path} is not a certificate index')
+        if self._records[:16] != build_id:
+            raise ValueError(f'{records_path} does not belong to {index_path}')
+        if len(self._index) != HEADER.size + self.count * self._entry.size:
+            raise ValueError(f'{index_path} is truncated')
+
+    def __len__(self):
+        return self.count
+
+    def _key(self, position):
+        start = HEADER.size + position * self._entry.size
+        return self._index[start:start + self.key_width]
+
+    def cert_numbers(self):
+        """Every cert_number in the index, in sorted order"""
+        entries = memoryview(self._index)[HEADER.size:]
+        try:
+            return [key.rstrip(b'\0').decode() for key, _, _ in self._entry.iter_unpack(entries)]
+        finally:
+            entries.release()
+
+    def get(self, cert_number):
+        """The certificate dict for cert_number, or None"""
+        key = str(cert_number).encode()
+        if len(key) > self.key_width:
+            return None
+        key = key.ljust(self.key_width, b'\0')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.count or self._key(low) != key:
+            return None
+        _, offset, length = self._entry.unpack_from(self._index, HEADER.size + low * self._entry.size)
+        return json.loads(self._records[offset:offset + length])
+
+def open_record_index(index_path, records_path, signature):
+    """The RecordIndex when it exists and was built from signature, else None"""
+    try:
+        index = RecordIndex(index_path, records_path)
+    except (OSError, ValueError, struct.error) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Ignoring certificate index {index_path}: {e}")
+        return None
+    if index.signature != tuple(signature):
+        return None
+    return index
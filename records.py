@@ -0,0 +1,145 @@
+"""Compact in-memory certificates.
+
+A certificate loaded from the store is a tree of four dicts holding a
+couple of dozen separate objects. CertificateRecord keeps the same values
+in one __slots__ object instead:
+
+* repeated strings (type, title, description, birthdate and the address
+  fields) are interned, so a thousand certificates of one course share
+  one title;
+* the expiry date is an integer date ordinal, shared between records
+  expiring on the same day.
+
+The dict in the README's format is only rebuilt by to_dict(), when a
+certificate is serialized. Certificates that do not have exactly that
+shape (extra or missing keys, an expire_date that is not a plain ISO date)
+keep their original dict for to_dict(), so nothing is lost; their fields
+are still filled in where present.
+"""
+
+import sys
+from datetime import date, datetime
+from operator import attrgetter
+
+TOP_KEYS = {'cert_number', 'cert_type', 'owner', 'birthdate', 'address', 'contact', 'expire_date', 'is_valid'}
+GROUP_KEYS = {
+    'cert_type': ('type', 'year', 'number', 'title', 'description'),
+    'address': ('street', 'no', 'city', 'zip'),
+    'contact': ('phone', 'email')
+}
+INTERNED = ('type', 'title', 'description', 'birthdate', 'street', 'no', 'city', 'zip')
+
+_ints = {}
+_iso_dates = {}
+
+def _share(value):
+    if type(value) is str:
+        return sys.intern(value)
+    if type(value) is int:
+        return _ints.setdefault(value, value)
+    return value
+
+def iso_date(ordinal):
+    """YYYY-MM-DD for a date ordinal; one string per date"""
+    text = _iso_dates.get(ordinal)
+    if text is None:
+        text = _iso_dates.setdefault(ordinal, date.fromordinal(ordinal).isoformat())
+    return text
+
+def _pick(cert, group, name):
+    value = cert.get(group)
+    return value.get(name) if isinstance(value, dict) else None
+
+class CertificateRecord:
+    """One certificate; the fields of cert_type, address and contact are flattened"""
+
+    __slots__ = ('cert_number', 'type', 'year', 'number', 'title', 'description', 'owner', 'birthdate',
+                 'street', 'no', 'city', 'zip', 'phone', 'email', 'expires', 'is_valid', 'raw')
+
+    @classmethod
+    def from_dict(cls, cert):
+        record = cls()
+        record.cert_number = cert['cert_number']
+        for group, names in GROUP_KEYS.items():
+            for name in names:
+                value = _pick(cert, group, name)
+                setattr(record, name, _share(value) if name in INTERNED else value)
+        record.year = _share(record.year)
+        record.owner = cert.get('owner')
+        record.birthdate = _share(cert.get('birthdate'))
+        record.is_valid = cert.get('is_valid')
+        record.raw = None if cls._regular(cert) else cert
+
+        expire_date = cert.get('expire_date')
+        try:
+            record.expires = _share(datetime.strptime(expire_date, '%Y-%m-%d').toordinal())
+        except (TypeError, ValueError):
+            record.expires = None  # verify_certificate reports the parse error
+            record.raw = cert
+        if record.raw is None and iso_date(record.expires) != expire_date:
+            record.raw = cert  # e.g. 2025-1-5: parses, but would not round-trip
+        return record
+
+    @staticmethod
+    def _regular(cert):
+        if cert.keys() != TOP_KEYS:
+            return False
+        for group, names in GROUP_KEYS.items():
+            value = cert[group]
+            if type(value) is not dict or len(value) != len(names) or not all(name in value for name in names):
+                return False
+        return True
+
+    @property
+    def expire_date(self):
+        if self.raw is not None:
+            return self.raw.get('expire_date')
+        return iso_date(self.expires)
+
+    def owner_names(self):
+        """(first name, last name) of the owner in lower case, or (None, None)"""
+        names = str(self.owner or '').split()
+        if not names:
+            return None, None
+        return names[0].lower(), names[-1].lower()
+
+    def to_dict(self):
+        """The certificate in its stored JSON shape"""
+        if self.raw is not None:
+            return self.raw
+        return {
+            'cert_number': self.cert_number,
+            'cert_type': {
+                'type': self.type,
+                'year': self.year,
+                'number': self.number,
+                'title': self.title,
+                'description': self.description
+            },
+            'owner': self.owner,
+            'birthdate': self.birthdate,
+            'address': {
+                'street': self.street,
+                'no': self.no,
+                'city': self.city,
+                'zip': self.zip
+            },
+            'contact': {
+                'phone': self.phone,
+                'email': self.email
+            },
+            'expire_date': iso_date(self.expires),
+            'is_valid': self.is_valid
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, CertificateRecord):
+            return NotImplemented
+        return _values(self) == _values(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'CertificateRecord({self.cert_number!r})'
+
+_values = attrgetter(*CertificateRecord.__slots__)
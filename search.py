@@ -0,0 +1,198 @@
+"""In-memory certificate search over owner, title, e-mail and city.
+
+Two inverted indexes are kept per certificate:
+
+* trigram -> cert numbers, for substring matches of terms with three or
+  more characters and for fuzzy (typo tolerant) matches;
+* word -> cert numbers plus a sorted word list, for exact and prefix
+  matches of short terms.
+
+Text is case folded and stripped of accents, so "muller" finds "Müller".
+"""
+
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+WORD = re.compile(r'\w+')
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', str(text)).casefold()
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def searchable_fields(cert):
+    """The values the search covers, normalized, for a CertificateRecord"""
+    values = [cert.owner, cert.title, cert.email, cert.city]
+    return [normalize(value) for value in values if value]
+
+class SearchIndex:
+    """Ranked substring, prefix and fuzzy search over certificates.
+
+    Updated incrementally through apply(), which takes the change sets
+    CertificateIndex hands to its listeners.
+    """
+
+    # Fuzzy matching skips trigrams shared by more certificates than this
+    max_fuzzy_posting = 50000
+    min_similarity = 0.5
+
+    def __init__(self):
+        self.trigram_postings = {}
+        self.word_postings = {}
+        self.words = []
+        self.texts = {}
+        self.certs = {}
+        self._lock = threading.Lock()
+
+    def apply(self, changes):
+        with self._lock:
+            # For large change sets the sorted word list is rebuilt once at the
+            # end instead of inserting and deleting words one by one
+            bulk = len(changes) > max(64, len(self.certs) // 8)
+            for cert_number, (old, new) in changes.items():
+                if old is not None:
+                    self._remove(cert_number, bulk)
+                if new is not None:
+                    self._add(cert_number, new, bulk)
+            if bulk:
+                self.words = sorted(self.word_postings)
+
+    def _add(self, cert_number, cert, bulk=False):
+        text = '\n'.join(searchable_fields(cert))
+        # Split the stored text again so _remove() sees exactly the same fields
+        fields = text.split('\n')
+        self.certs[cert_number] = cert
+        self.texts[cert_number] = text
+        for gram in set().union(*map(trigrams, fields)):
+            postings = self.trigram_postings.get(gram)
+            if postings is None:
+                postings = self.trigram_postings[gram] = set()
+            postings.add(cert_number)
+        for word in {word for field in fields for word in WORD.findall(field)}:
+            postings = self.word_postings.get(word)
+            if postings is None:
+                postings = self.word_postings[word] = set()
+                if not bulk:
+                    bisect.insort(self.words, word)
+            postings.add(cert_number)
+
+    def _remove(self, cert_number, bulk=False):
+        text = self.texts.pop(cert_number, None)
+        self.certs.pop(cert_number, None)
+        if text is None:
+            return
+        fields = text.split('\n')
+        for gram in set().union(*map(trigrams, fields)):
+            postings = self.trigram_postings.get(gram)
+            if postings is not None:
+                postings.discard(cert_number)
+                if not postings:
+                    del self.trigram_postings[gram]
+        for word in {word for field in fields for word in WORD.findall(field)}:
+            postings = self.word_postings.get(word)
+            if postings is not None:
+                postings.discard(cert_number)
+                if not postings:
+                    del self.word_postings[word]
+                    if not bulk:
+                        del self.words[bisect.bisect_left(self.words, word)]
+
+    def _term_cost(self, term):
+        """Rough number of candidates a term yields, to match rare terms first"""
+        if len(term) < 3:
+            return len(self.certs)
+        return min(len(self.trigram_postings.get(gram, ())) for gram in trigrams(term))
+
+    def _term_matches(self, term, within=None):
+        """Cert numbers containing term, scored 3 (whole word), 2 (word prefix) or 1 (substring).
+
+        within, when given, restricts the candidates (matches of earlier terms).
+        """
+        if len(term) < 3:
+            # Too short for trigrams: expand it as a word prefix
+            matches = {}
+            position = bisect.bisect_left(self.words, term)
+            while position < len(self.words) and self.words[position].startswith(term):
+                word = self.words[position]
+                score = 3 if word == term else 2
+                for cert_number in self.word_postings[word]:
+                    if within is not None and cert_number not in within:
+                        continue
+                    if matches.get(cert_number, 0) < score:
+                        matches[cert_number] = score
+                position += 1
+            return matches
+
+        postings = [self.trigram_postings.get(gram) for gram in trigrams(term)]
+        if not all(postings):
+            return {}
+        postings.sort(key=len)
+        if within is not None and len(within) < len(postings[0]):
+            postings.insert(0, within)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        exact = self.word_postings.get(term, ())
+        word_start = re.compile(r'(?<!\w)' + re.escape(term))
+        matches = {}
+        for cert_number in candidates:
+            text = self.texts[cert_number]
+            if cert_number in exact:
+                matches[cert_number] = 3
+            elif word_start.search(text):
+                matches[cert_number] = 2
+            elif term in text:
+                matches[cert_number] = 1
+        return matches
+
+    def _fuzzy_matches(self, query):
+        """Cert numbers sharing most of the query's trigrams, scored by that share"""
+        grams = trigrams(query)
+        if not grams:
+            return {}
+        hits = Counter()
+        for gram in grams:
+            postings = self.trigram_postings.get(gram, ())
+            if len(postings) <= self.max_fuzzy_posting:
+                hits.update(postings)
+        return {
+            cert_number: count / len(grams)
+            for cert_number, count in hits.items()
+            if count / len(grams) >= self.min_similarity
+        }
+
+    def search(self, query, limit=20, offset=0, fuzzy=True):
+        """Return (total, [(score, record), ...]) for one page of ranked results.
+
+        Every whitespace separated term must match. When nothing does and
+        fuzzy is set, certificates sharing most trigrams with the query are
+        returned instead, scored by their share of matching trigrams (at most 1).
+        """
+        query = normalize(query).strip()
+        terms = query.split()
+        if not terms:
+            return 0, []
+
+        with self._lock:
+            scores = None
+            for term in sorted(set(terms), key=self._term_cost):
+                matches = self._term_matches(term, scores)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {
+                        cert_number: score + matches[cert_number]
+                        for cert_number, score in scores.items() if cert_number in matches
+                    }
+                if not scores:
+                    break
+            if not scores and fuzzy:
+                scores = self._fuzzy_matches(query)
+
+            ranked = heapq.nsmallest(offset + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+            page = [(score, self.certs[cert_number]) for cert_number, score in ranked[offset:]]
+            return len(scores), page
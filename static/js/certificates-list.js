@@ -30,6 +30,61 @@ function initializeCertificatesGrid(certificatesData) {
     });
 }
 
+// Fetch the certificates page by page while the end of the grid is in view
+function loadCertificates(params) {
+    const certificatesGrid = document.querySelector('.certificates-grid');
+    const sentinel = document.createElement('div');
+    certificatesGrid.after(sentinel);
+
+    let cursor = null;
+    let loading = false;
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadPage();
+        }
+    }, { rootMargin: '400px' });
+
+    function loadPage() {
+        if (loading) {
+            return;
+        }
+        loading = true;
+
+        const query = new URLSearchParams(params);
+        query.set('limit', 100);
+        if (cursor) {
+            query.set('cursor', cursor);
+        }
+
+        fetch(`/admin/api/certificates?${query}`, {
+            headers: { 'Accept': 'application/json' }
+        })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            return response.json();
+        })
+        .then(data => {
+            initializeCertificatesGrid(data.certificates);
+            cursor = data.next_cursor;
+            loading = false;
+            observer.unobserve(sentinel);
+            if (cursor) {
+                // Re-observing reports the sentinel again if it is still visible
+                observer.observe(sentinel);
+            }
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            observer.disconnect();
+        });
+    }
+
+    observer.observe(sentinel);
+}
+
 function deleteCertificate(certNumber) {
     if (confirm('Are you sure you want to delete this certificate?')) {
         fetch(`/admin/certificates/delete/${certNumber}`, {
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Static asset lookup for /static/.
+
+Small files are kept in an LRU memory cache; larger ones are left on disk
+for the handler to send with os.sendfile. Every lookup stats
+the file, so edited assets are picked up without a restart. When the
+client accepts gzip and a pre-built ``<file>.gz`` sits next to the asset,
+the compressed variant is served instead. The variants themselves are not
+served under their own names.
+
+Build the gzip variants with:
+    python staticfiles.py compress
+"""
+
+import argparse
+import gzip
+import mimetypes
+import os
+import sys
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+STATIC_DIR = 'static'
+
+# Types mimetypes gets wrong or does not know on every platform
+CONTENT_TYPES = {
+    '.css': 'text/css',
+    '.js': 'text/javascript',
+    '.mjs': 'text/javascript',
+    '.json': 'application/json',
+    '.svg': 'image/svg+xml',
+    '.png': 'image/png',
+    '.ico': 'image/x-icon',
+    '.webp': 'image/webp',
+    '.woff': 'font/woff',
+    '.woff2': 'font/woff2',
+    '.map': 'application/json',
+}
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'image/svg+xml')
+
+def content_type_for(path):
+    extension = os.path.splitext(path)[1].lower()
+    content_type = CONTENT_TYPES.get(extension) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if content_type.startswith('text/') or content_type in ('application/json', 'image/svg+xml'):
+        content_type += '; charset=utf-8'
+    return content_type
+
+def is_compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+def accepts_gzip(accept_encoding):
+    """True when an Accept-Encoding header allows gzip (q > 0, directly or through *)"""
+    qualities = {}
+    for item in (accept_encoding or '').split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    if 'gzip' in qualities:
+        return qualities['gzip'] > 0
+    return qualities.get('*', 0) > 0
+
+def etag_matches(etag, if_none_match):
+    """True when an If-None-Match header lists etag (strong or weak) or is *"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+class Asset:
+    """A resolved static file; body is set when it came from the memory cache"""
+
+    __slots__ = ('path', 'content_type', 'encoding', 'size', 'mtime', 'etag', 'last_modified', 'body')
+
+    def __init__(self, path, content_type, encoding, stat, body=None):
+        self.path = path
+        self.content_type = content_type
+        self.encoding = encoding
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime_ns
+        suffix = '-gz' if encoding == 'gzip' else ''
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{suffix}"'
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.body = body
+
+    def matches(self, if_none_match=None, if_modified_since=None):
+        """True when a conditional GET can be answered with 304"""
+        if if_none_match:
+            return etag_matches(self.etag, if_none_match)
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(self.mtime / 1e9) <= since
+        return False
+
+class StaticFiles:
+    """Resolve /static/ paths to cached or sendfile-able assets"""
+
+    def __init__(self, root=STATIC_DIR, cache_size=16 * 1024 * 1024, max_cached_file=256 * 1024, max_age=3600):
+        self.root = os.path.realpath(root)
+        self.cache_size = cache_size
+        self.max_cached_file = max_cached_file
+        self.max_age = max_age
+        self.cache = OrderedDict()
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def resolve(self, url_path):
+        """Filesystem path for a decoded URL path below the root, or None"""
+        path = os.path.realpath(os.path.join(self.root, url_path.lstrip('/')))
+        if not path.startswith(self.root + os.sep):
+            return None
+        return path
+
+    def lookup(self, url_path, accept_encoding=''):
+        """Return an Asset for the path, or None when it does not exist"""
+        path = self.resolve(url_path)
+        # Only reachable as the gzip variant of their source
+        if path is None or path.endswith('.gz'):
+            return None
+        content_type = content_type_for(path)
+        if accepts_gzip(accept_encoding) and is_compressible(content_type):
+            asset = self._load(path + '.gz', content_type, 'gzip')
+            # A variant older than its source is stale until rebuilt
+            if asset is not None and asset.mtime == self._mtime(path):
+                return asset
+        return self._load(path, content_type, None)
+
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self, path, content_type, encoding):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        with self.lock:
+            asset = self.cache.get(path)
+            if asset is not None:
+                if asset.mtime == stat.st_mtime_ns and asset.size == stat.st_size:
+                    self.cache.move_to_end(path)
+                    self.hits += 1
+                    return asset
+                self._evict(path)
+            self.misses += 1
+
+        if stat.st_size > self.max_cached_file:
+            return Asset(path, content_type, encoding, stat)
+
+        try:
+            with open(path, 'rb') as file:
+                body = file.read()
+        except OSError:
+            return None
+        asset = Asset(path, content_type, encoding, stat, body)
+        with self.lock:
+            if path not in self.cache:
+                self.cache[path] = asset
+                self.cached_bytes += len(body)
+                while self.cached_bytes > self.cache_size and self.cache:
+                    self._evict(next(iter(self.cache)))
+        return asset
+
+    def _evict(self, path):
+        asset = self.cache.pop(path, None)
+        if asset is not None:
+            self.cached_bytes -= len(asset.body)
+
+def compress(root=STATIC_DIR, min_size=256):
+    """Write <file>.gz next to every compressible asset that changed"""
+    written = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            if name.endswith('.gz') or not is_compressible(content_type_for(path)):
+                continue
+            stat = os.stat(path)
+            target = path + '.gz'
+            if stat.st_size < min_size:
+                continue
+            if os.path.exists(target) and os.stat(target).st_mtime_ns == stat.st_mtime_ns:
+                continue
+            with open(path, 'rb') as file:
+                data = gzip.compress(file.read(), compresslevel=9, mtime=0)
+            if len(data) >= stat.st_size:
+                continue
+            with open(target, 'wb') as file:
+                file.write(data)
+            # Matching mtimes mark the variant as up to date
+            os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            written += 1
+            print(f'{target}: {stat.st_size} -> {len(data)} bytes')
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Static asset tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compress_parser = subparsers.add_parser('compress', help='build gzip variants of text assets')
+    compress_parser.add_argument('--root', default=STATIC_DIR)
+    args = parser.parse_args(argv)
+    if args.command == 'compress':
+        print(f'{compress(args.root)} file(s) compressed')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,656 @@
+#!/usr/bin/env python3
+"""Storage backends for certificates and administrators.
+
+JSONStore keeps the original data/certificates.json and data/admin.json
+files and suits small installs. JournaledJSONStore keeps the same files
+but appends certificate changes to data/certificates.journal and folds
+them into the snapshot in the background. SQLiteStore keeps the same records in a
+single SQLite database with indexed lookups and single-row writes.
+
+JSONStore also keeps a sorted, memory-mapped index of certificates.json
+(see recordindex.py) so that single lookups need not load the whole file.
+
+Migrate existing JSON data with:
+    python storage.py migrate --database data/certverif.db
+
+Build the certificate index for an existing certificates.json with:
+    python storage.py index
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from recordindex import open_record_index, write_record_index
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process file locking
+    fcntl = None
+
+CERTIFICATES_FILE = 'data/certificates.json'
+ADMINS_FILE = 'data/admin.json'
+SEQUENCES_FILE = 'data/sequences.json'
+DATABASE_FILE = 'data/certverif.db'
+
+def generate_cert_number(cert_type_year, cert_type_number, issue_date):
+    """Generate certificate number in format: CV24-001-241121"""
+    year_suffix = str(cert_type_year)[-2:]  # Get last 2 digits of year
+    number_formatted = f"{cert_type_number:03d}"  # Format number as 3 digits with leading zeros
+    date_formatted = issue_date.strftime("%y%m%d")  # Format date as YYMMDD
+    return f"CV{year_suffix}-{number_formatted}-{date_formatted}"
+
+class DataLock:
+    """Re-entrant lock serializing writers across threads and processes.
+
+    Threads of one process share an RLock; processes additionally take an
+    exclusive flock on a lock file so pre-forked workers do not clobber
+    each other's writes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+        self._pid = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl:
+            if self._pid != os.getpid():
+                # Lock files must not be shared with the parent after fork
+                self._file = open(self.path, 'a')
+                self._pid = os.getpid()
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth == 0 and fcntl:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._lock.release()
+
+def save_json(path, data):
+    """Write a JSON data file atomically so readers never see a partial file"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+class JSONStore:
+    """Certificates and administrators kept in the flat JSON files"""
+
+    def __init__(self, certificates_path=CERTIFICATES_FILE, admins_path=ADMINS_FILE):
+        self.certificates_path = certificates_path
+        self.admins_path = admins_path
+        self.sequences_path = os.path.join(os.path.dirname(certificates_path), 'sequences.json')
+        base = os.path.splitext(certificates_path)[0]
+        self.index_path = base + '.idx'
+        self.records_path = base + '.records'
+        self.lock = DataLock(os.path.join(os.path.dirname(certificates_path), '.lock'))
+
+    def transaction(self):
+        """Group several reads and writes into one atomic step"""
+        return self.lock
+
+    def version(self):
+        """Token that changes whenever the certificate data changes"""
+        st = os.stat(self.certificates_path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _load(self, path):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    # Certificates
+
+    def _save_certificates(self, certs):
+        save_json(self.certificates_path, certs)
+        write_record_index(certs['certificates'], self.index_path, self.records_path, self.version())
+
+    def build_record_index(self):
+        """(Re)write the certificate index from certificates.json"""
+        with self.lock:
+            write_record_index(self.load_certificates(), self.index_path, self.records_path, self.version())
+
+    def record_index(self):
+        """Memory-mapped index of certificates.json, or None when missing or out of date"""
+        return open_record_index(self.index_path, self.records_path, self.version())
+
+    def load_certificates(self):
+        return self._load(self.certificates_path)['certificates']
+
+    def get_certificate(self, cert_number):
+        return next((c for c in self.load_certificates()
+                     if c['cert_number'] == cert_number), None)
+
+    def allocate_number(self, year, count=1):
+        """Reserve count consecutive certificate numbers for a year, never reusing one.
+
+        Returns the first reserved number. Counters live in sequences.json;
+        a year is seeded once from the highest number already issued, later
+        calls are O(1).
+        """
+        with self.lock:
+            try:
+                sequences = self._load(self.sequences_path)
+            except FileNotFoundError:
+                sequences = {}
+            key = str(year)
+            if key not in sequences:
+                sequences[key] = max((c['cert_type']['number'] for c in self.load_certificates()
+                                      if c['cert_type']['year'] == year), default=0)
+            sequences[key] += count
+            save_json(self.sequences_path, sequences)
+            return sequences[key] - count + 1
+
+    def add_certificate(self, cert):
+        self.add_certificates([cert])
+
+    def add_certificates(self, new_certs):
+        """Append several certificates with a single file write"""
+        with self.lock:
+            certs = self._load(self.certificates_path)
+            certs['certificates'].extend(new_certs)
+            self._save_certificates(certs)
+
+    def update_certificate(self, cert_number, cert):
+        with self.lock:
+            certs = self._load(self.certificates_path)
+            cert_index = next((i for i, c in enumerate(certs['certificates'])
+                               if c['cert_number'] == cert_number), None)
+            if cert_index is None:
+                return False
+            certs['certificates'][cert_index] = cert
+            self._save_certificates(certs)
+            return True
+
+    def delete_certificate(self, cert_number):
+        with self.lock:
+            certs = self._load(self.certificates_path)
+            initial_length = len(certs['certificates'])
+            certs['certificates'] = [c for c in certs['certificates']
+                                     if c['cert_number'] != cert_number]
+            if len(certs['certificates']) == initial_length:
+                return False
+            self._save_certificates(certs)
+            return True
+
+    # Administrators
+
+    def load_admins(self):
+        return self._load(self.admins_path)['administrators']
+
+    def get_admin(self, username):
+        return next((a for a in self.load_admins() if a['username'] == username), None)
+
+    def add_admin(self, admin):
+        with self.lock:
+            admins = self._load(self.admins_path)
+            if any(a['username'] == admin['username'] for a in admins['administrators']):
+                return False
+            admins['administrators'].append(admin)
+            save_json(self.admins_path, admins)
+            return True
+
+    def update_admin(self, username, admin):
+        with self.lock:
+            admins = self._load(self.admins_path)
+            admin_index = next((i for i, a in enumerate(admins['administrators'])
+                                if a['username'] == username), None)
+            if admin_index is None:
+                return False
+            admins['administrators'][admin_index] = admin
+            save_json(self.admins_path, admins)
+            return True
+
+    def delete_admin(self, username):
+        with self.lock:
+            admins = self._load(self.admins_path)
+            initial_length = len(admins['administrators'])
+            admins['administrators'] = [a for a in admins['administrators']
+                                        if a['username'] != username]
+            if len(admins['administrators']) == initial_length:
+                return False
+            save_json(self.admins_path, admins)
+            return True
+
+class JournaledJSONStore(JSONStore):
+    """JSONStore that appends certificate changes to a journal file.
+
+    Creates, edits and deletes are appended to certificates.journal as
+    one NDJSON record each instead of rewriting certificates.json, so a
+    write costs the same regardless of dataset size. The journal is
+    replayed on load; a background thread folds it into a fresh snapshot
+    (atomic rename) once it holds compact_threshold records.
+    """
+
+    def __init__(self, certificates_path=CERTIFICATES_FILE, admins_path=ADMINS_FILE,
+                 journal_path=None, compact_interval=30, compact_threshold=1000):
+        super().__init__(certificates_path, admins_path)
+        self.journal_path = journal_path or os.path.splitext(certificates_path)[0] + '.journal'
+        self.compact_interval = compact_interval
+        self.compact_threshold = compact_threshold
+        self._state_lock = threading.Lock()
+        self._certificates = None
+        self._snapshot_signature = None
+        self._journal_inode = None
+        self._journal_offset = 0
+        self._journal_records = 0
+        self._compactor_pid = None
+
+    def _file_signature(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def version(self):
+        return (self._file_signature(self.certificates_path), self._file_signature(self.journal_path))
+
+    def build_record_index(self):
+        pass
+
+    def record_index(self):
+        # Changes still in the journal are not in the index
+        return None
+
+    def _apply(self, record):
+        certs = self._certificates
+        op = record['op']
+        if op == 'add':
+            certs[record['cert']['cert_number']] = record['cert']
+        elif op == 'update':
+            cert = record['cert']
+            if record['cert_number'] != cert['cert_number']:
+                certs.pop(record['cert_number'], None)
+            certs[cert['cert_number']] = cert
+        elif op == 'delete':
+            certs.pop(record['cert_number'], None)
+
+    def _replay(self, journal):
+        journal.seek(self._journal_offset)
+        data = journal.read()
+        # An unterminated last line is a write still in progress (or a crash)
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"Skipping corrupt record in {self.journal_path}")
+                continue
+            self._apply(record)
+            self._journal_records += 1
+        self._journal_offset += end
+        return len(data) > end
+
+    def _sync(self):
+        """Bring the in-memory certificates up to date with snapshot + journal"""
+        with self._state_lock:
+            # Open the journal before reading the snapshot: compaction replaces
+            # the snapshot first, so this journal covers whatever we read next
+            try:
+                journal = open(self.journal_path, 'rb')
+            except FileNotFoundError:
+                journal = None
+            try:
+                inode = os.fstat(journal.fileno()).st_ino if journal else None
+                snapshot = self._file_signature(self.certificates_path)
+                if (self._certificates is None or snapshot != self._snapshot_signature
+                        or inode != self._journal_inode):
+                    self._certificates = {}
+                    for cert in JSONStore.load_certificates(self):
+                        self._certificates.setdefault(cert['cert_number'], cert)
+                    self._snapshot_signature = snapshot
+                    self._journal_inode = inode
+                    self._journal_offset = 0
+                    self._journal_records = 0
+                partial = self._replay(journal) if journal else False
+            finally:
+                if journal:
+                    journal.close()
+            return self._certificates, partial
+
+    def _append(self, *records):
+        """Durably append records with one write and fsync; caller holds self.lock"""
+        _, partial = self._sync()
+        with open(self.journal_path, 'ab') as f:
+            if partial:
+                # Terminate a torn record left by a crashed writer
+                f.write(b'\n')
+            f.write(b''.join(json.dumps(record).encode() + b'\n' for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        self._sync()
+        self._start_compactor()
+
+    # Certificates
+
+    def load_certificates(self):
+        return list(self._sync()[0].values())
+
+    def get_certificate(self, cert_number):
+        return self._sync()[0].get(cert_number)
+
+    def add_certificates(self, new_certs):
+        with self.lock:
+            self._append(*({'op': 'add', 'cert': cert} for cert in new_certs))
+
+    def update_certificate(self, cert_number, cert):
+        with self.lock:
+            if cert_number not in self._sync()[0]:
+                return False
+            self._append({'op': 'update', 'cert_number': cert_number, 'cert': cert})
+            return True
+
+    def delete_certificate(self, cert_number):
+        with self.lock:
+            if cert_number not in self._sync()[0]:
+                return False
+            self._append({'op': 'delete', 'cert_number': cert_number})
+            return True
+
+    # Compaction
+
+    def compact(self):
+        """Fold the journal into a new snapshot and keep only the unfolded tail"""
+        with self.lock:
+            certs, _ = self._sync()
+            if not self._journal_records:
+                return False
+            snapshot = list(certs.values())
+            offset = self._journal_offset
+            records = self._journal_records
+            inode = self._journal_inode
+
+        # Writing the snapshot is the slow part; writers keep appending meanwhile
+        snapshot_tmp = f'{self.certificates_path}.{os.getpid()}.tmp'
+        with open(snapshot_tmp, 'w') as f:
+            json.dump({'certificates': snapshot}, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self.lock:
+            self._sync()
+            if self._journal_inode != inode:
+                # Another process compacted first
+                os.remove(snapshot_tmp)
+                return False
+            with open(self.journal_path, 'rb') as f:
+                f.seek(offset)
+                tail = f.read()
+            journal_tmp = f'{self.journal_path}.{os.getpid()}.tmp'
+            with open(journal_tmp, 'wb') as f:
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(snapshot_tmp, self.certificates_path)
+            os.replace(journal_tmp, self.journal_path)
+
+            # Memory already matches snapshot + tail, so skip the reload
+            with self._state_lock:
+                self._snapshot_signature = self._file_signature(self.certificates_path)
+                self._journal_inode = os.stat(self.journal_path).st_ino
+                self._journal_offset -= offset
+                self._journal_records -= records
+        return True
+
+    def _start_compactor(self):
+        if self._compactor_pid == os.getpid():
+            return
+        self._compactor_pid = os.getpid()
+        thread = threading.Thread(target=self._compact_loop, name='certverif-compactor', daemon=True)
+        thread.start()
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(self.compact_interval)
+            try:
+                if self._journal_records >= self.compact_threshold:
+                    self.compact()
+            except Exception as e:
+                print(f"Journal compaction error: {e}")
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS certificates (
+    cert_number TEXT PRIMARY KEY,
+    year INTEGER NOT NULL,
+    number INTEGER NOT NULL,
+    expire_date TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_certificates_expire_date ON certificates (expire_date);
+CREATE INDEX IF NOT EXISTS idx_certificates_year_number ON certificates (year, number);
+
+CREATE TABLE IF NOT EXISTS administrators (
+    username TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL,
+    role TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sequences (
+    year INTEGER PRIMARY KEY,
+    last INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+
+CREATE TRIGGER IF NOT EXISTS certificates_insert AFTER INSERT ON certificates
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+CREATE TRIGGER IF NOT EXISTS certificates_update AFTER UPDATE ON certificates
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+CREATE TRIGGER IF NOT EXISTS certificates_delete AFTER DELETE ON certificates
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+'''
+
+class SQLiteStore:
+    """Certificates and administrators kept in a SQLite database (WAL mode).
+
+    Each thread (and each forked process) uses its own connection. Writes
+    touch a single row; transaction() wraps several operations in one
+    BEGIN IMMEDIATE ... COMMIT.
+    """
+
+    def __init__(self, path=DATABASE_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.depth = 0
+        return conn
+
+    def transaction(self):
+        return _SQLiteTransaction(self)
+
+    def version(self):
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    # Certificates
+
+    def load_certificates(self):
+        rows = self._connect().execute('SELECT data FROM certificates ORDER BY rowid')
+        return [json.loads(data) for (data,) in rows]
+
+    def get_certificate(self, cert_number):
+        row = self._connect().execute(
+            'SELECT data FROM certificates WHERE cert_number = ?', (cert_number,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def allocate_number(self, year, count=1):
+        """Reserve count consecutive certificate numbers for a year; returns the first"""
+        with self.transaction() as conn:
+            # Seed the counter once from the highest number already issued
+            conn.execute(
+                'INSERT OR IGNORE INTO sequences (year, last) '
+                'SELECT ?, COALESCE(MAX(number), 0) FROM certificates WHERE year = ?',
+                (year, year)
+            )
+            conn.execute('UPDATE sequences SET last = last + ? WHERE year = ?', (count, year))
+            return conn.execute('SELECT last FROM sequences WHERE year = ?', (year,)).fetchone()[0] - count + 1
+
+    def _certificate_row(self, cert):
+        return (cert['cert_number'], cert['cert_type']['year'], cert['cert_type']['number'],
+                cert['expire_date'], json.dumps(cert))
+
+    def add_certificate(self, cert):
+        self.add_certificates([cert])
+
+    def add_certificates(self, certs):
+        with self.transaction() as conn:
+            conn.executemany(
+                'INSERT INTO certificates (cert_number, year, number, expire_date, data) VALUES (?, ?, ?, ?, ?)',
+                [self._certificate_row(cert) for cert in certs]
+            )
+
+    def update_certificate(self, cert_number, cert):
+        cert_number_new, year, number, expire_date, data = self._certificate_row(cert)
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE certificates SET cert_number = ?, year = ?, number = ?, expire_date = ?, data = ? '
+                'WHERE cert_number = ?',
+                (cert_number_new, year, number, expire_date, data, cert_number)
+            )
+            return cursor.rowcount > 0
+
+    def delete_certificate(self, cert_number):
+        with self.transaction() as conn:
+            cursor = conn.execute('DELETE FROM certificates WHERE cert_number = ?', (cert_number,))
+            return cursor.rowcount > 0
+
+    # Administrators
+
+    def _admin(self, row):
+        return {'username': row[0], 'password_hash': row[1], 'role': row[2]}
+
+    def load_admins(self):
+        rows = self._connect().execute(
+            'SELECT username, password_hash, role FROM administrators ORDER BY rowid')
+        return [self._admin(row) for row in rows]
+
+    def get_admin(self, username):
+        row = self._connect().execute(
+            'SELECT username, password_hash, role FROM administrators WHERE username = ?', (username,)
+        ).fetchone()
+        return self._admin(row) if row else None
+
+    def add_admin(self, admin):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO administrators (username, password_hash, role) VALUES (?, ?, ?)',
+                (admin['username'], admin['password_hash'], admin['role'])
+            )
+            return cursor.rowcount > 0
+
+    def update_admin(self, username, admin):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE administrators SET username = ?, password_hash = ?, role = ? WHERE username = ?',
+                (admin['username'], admin['password_hash'], admin['role'], username)
+            )
+            return cursor.rowcount > 0
+
+    def delete_admin(self, username):
+        with self.transaction() as conn:
+            cursor = conn.execute('DELETE FROM administrators WHERE username = ?', (username,))
+            return cursor.rowcount > 0
+
+class _SQLiteTransaction:
+    """Re-entrant BEGIN IMMEDIATE ... COMMIT on the calling thread's connection"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        conn = self.store._connect()
+        local = self.store._local
+        if local.depth == 0:
+            conn.execute('BEGIN IMMEDIATE')
+        local.depth += 1
+        return conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        local = self.store._local
+        local.depth -= 1
+        if local.depth == 0:
+            local.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+def open_store(backend='json', database=DATABASE_FILE):
+    """Create the storage backend selected on the command line"""
+    if backend == 'sqlite':
+        return SQLiteStore(database)
+    journaled = JournaledJSONStore()
+    if backend == 'journal':
+        return journaled
+    # Fold changes left behind by an earlier journal-mode run
+    if os.path.exists(journaled.journal_path):
+        journaled.compact()
+    return JSONStore()
+
+def migrate(database=DATABASE_FILE, certificates_path=CERTIFICATES_FILE, admins_path=ADMINS_FILE):
+    """Copy the JSON data files into a SQLite database in one transaction"""
+    source = JournaledJSONStore(certificates_path, admins_path)
+    target = SQLiteStore(database)
+    certificates = source.load_certificates()
+    admins = source.load_admins()
+    try:
+        sequences = source._load(source.sequences_path)
+    except FileNotFoundError:
+        sequences = {}
+    with target.transaction() as conn:
+        conn.execute('DELETE FROM certificates')
+        conn.execute('DELETE FROM administrators')
+        conn.execute('DELETE FROM sequences')
+        for year, last in sequences.items():
+            conn.execute('INSERT INTO sequences (year, last) VALUES (?, ?)', (int(year), last))
+        for cert in certificates:
+            conn.execute(
+                'INSERT OR IGNORE INTO certificates (cert_number, year, number, expire_date, data) '
+                'VALUES (?, ?, ?, ?, ?)',
+                target._certificate_row(cert)
+            )
+        for admin in admins:
+            conn.execute(
+                'INSERT OR REPLACE INTO administrators (username, password_hash, role) VALUES (?, ?, ?)',
+                (admin['username'], admin['password_hash'], admin['role'])
+            )
+    return len(certificates), len(admins)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CertVerif storage tools')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subcommands.add_parser('migrate', help='copy the JSON data files into SQLite')
+    migrate_parser.add_argument('--database', default=DATABASE_FILE)
+    migrate_parser.add_argument('--certificates', default=CERTIFICATES_FILE)
+    migrate_parser.add_argument('--admins', default=ADMINS_FILE)
+    index_parser = subcommands.add_parser('index', help='build the certificate index next to certificates.json')
+    index_parser.add_argument('--certificates', default=CERTIFICATES_FILE)
+    args = parser.parse_args()
+
+    if args.command == 'index':
+        store = JSONStore(args.certificates)
+        store.build_record_index()
+        print(f"Indexed {len(store.record_index())} certificates in {store.index_path}")
+    elif args.command == 'migrate':
+        cert_count, admin_count = migrate(args.database, args.certificates, args.admins)
+        print(f"Migrated {cert_count} certificates and {admin_count} administrators to {args.database}")
@@ -0,0 +1,111 @@
+"""Precompiled HTML templates.
+
+Each template is read once and split at its {{NAME}} / {{{NAME}}}
+placeholders into pre-encoded byte segments, so rendering is a single
+bytes join. Placeholders without a value are emitted unchanged (e.g. the
+{{#if ...}} markers in admin_form.html are left for the browser side).
+"""
+
+import os
+import re
+import threading
+import time
+
+TEMPLATES_DIR = 'templates'
+
+PLACEHOLDER = re.compile(r'\{\{\{([^{}]+)\}\}\}|\{\{([^{}]+)\}\}')
+
+class Template:
+    """A template split into literal byte segments and placeholder names"""
+
+    __slots__ = ('segments', 'names', 'markers', 'mtime')
+
+    def __init__(self, source, mtime=None):
+        self.segments = []
+        self.names = []
+        self.markers = []
+        self.mtime = mtime
+        position = 0
+        for match in PLACEHOLDER.finditer(source):
+            self.segments.append(source[position:match.start()].encode())
+            self.names.append((match.group(1) or match.group(2)).strip())
+            self.markers.append(match.group(0).encode())
+            position = match.end()
+        self.segments.append(source[position:].encode())
+
+    def render(self, values):
+        parts = [self.segments[0]]
+        for name, marker, segment in zip(self.names, self.markers, self.segments[1:]):
+            value = values.get(name)
+            if value is None:
+                parts.append(marker)
+            elif isinstance(value, bytes):
+                parts.append(value)
+            else:
+                parts.append(str(value).encode())
+            parts.append(segment)
+        return b''.join(parts)
+
+class TemplateCache:
+    """Process-wide cache of compiled templates.
+
+    With watch=True (development) a background thread polls the files of
+    cached templates and drops entries whose mtime changed, so edits show
+    up on the next request without a restart.
+    """
+
+    def __init__(self, directory=TEMPLATES_DIR, watch=False, interval=1.0):
+        self.directory = directory
+        self.watch = watch
+        self.interval = interval
+        self.templates = {}
+        self.lock = threading.Lock()
+        self.watcher_pid = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        template = self.templates.get(name)
+        if template is None:
+            if self.watch:
+                self._start_watcher()
+            path = self.path(name)
+            with open(path, 'r') as file:
+                mtime = os.fstat(file.fileno()).st_mtime_ns
+                template = Template(file.read(), mtime)
+            with self.lock:
+                template = self.templates.setdefault(name, template)
+        return template
+
+    def render(self, name, **values):
+        return self.get(name).render(values)
+
+    def invalidate(self, name=None):
+        with self.lock:
+            if name is None:
+                self.templates.clear()
+            else:
+                self.templates.pop(name, None)
+
+    def _start_watcher(self):
+        # One watcher per process (prefork workers start their own)
+        with self.lock:
+            if self.watcher_pid == os.getpid():
+                return
+            self.watcher_pid = os.getpid()
+        threading.Thread(target=self._watch_loop, daemon=True).start()
+
+    def _watch_loop(self):
+        while True:
+            time.sleep(self.interval)
+            for name, template in list(self.templates.items()):
+                try:
+                    mtime = os.stat(self.path(name)).st_mtime_ns
+                except OSError:
+                    mtime = None
+                if mtime != template.mtime:
+                    print(f"Template changed, reloading: {name}")
+                    with self.lock:
+                        if self.templates.get(name) is template:
+                            del self.templates[name]